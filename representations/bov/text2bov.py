@@ -10,56 +10,32 @@
 ################################################################################
  
 from __future__ import print_function
-import filecmp
-import datetime
 import argparse
 import codecs
 import logging
 import nltk
+import numpy
 import os
 import sys
+import multiprocessing
+import functools
+import itertools
 import time
-import math
+
+try:
+    import scipy.sparse
+except ImportError:    #Only needed by the TF-IDF weighting.
+    scipy = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tools"))
+import instrumentation    #Shared progress bar and metrics (tools/instrumentation.py).
+import pipeline    #Model loading and BoV encoding (tools/pipeline.py).
 
 
 ################################################################################
 ### FUNCTIONS                                                                ###
 ################################################################################
 
-# Print iterations progress: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
-def print_progress(iteration, total, estimation, prefix='Progress:', decimals=1, bar_length=100, final=False):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        estimation  - Required  : iteration estimation in seconds (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        bar_length  - Optional  : character length of bar (Int)
-    """
-    rows, columns = os.popen('stty size', 'r').read().split()
-    eta = str( datetime.timedelta(seconds=max(0, int( math.ceil(estimation) ))) )
-    bar_length = int(columns)-len(prefix)-len(eta)-15
-    str_format = "{0:." + str(decimals) + "f}"
-    percents = str_format.format(100 * (iteration / float(total)))
-    filled_length = int(round(bar_length * iteration / float(total)))
-    bar = '█' * filled_length + '-' * (bar_length - filled_length)
-    sys.stdout.write('\r%s |%s| %s%s ETA %s' % (prefix, bar, percents, '%', eta))
-
-    if final == True:    #iteration == total
-        sys.stdout.write('\n')
-        
-    sys.stdout.flush()
-    del rows
-
-
-#Format a value in seconds to "day, HH:mm:ss".
-def format_time(seconds):
-    return str( datetime.timedelta(seconds=max(0, int( math.ceil(seconds) ))) )
-
-
 #Convert a string value to boolean:
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
@@ -82,6 +58,305 @@ def natural(v):
     except ValueError:
         raise argparse.ArgumentTypeError("invalid natural number value: " + "'" + v + "'")
 
+
+#Convert a comma-separated list of pooling strategies (e.g. "mean,max") to a list without repetitions:
+def poolings(v):
+    strategies = []
+    
+    for pooling in v.split(","):
+        if pooling not in pipeline.POOLINGS:
+            raise argparse.ArgumentTypeError("invalid pooling value: " + "'" + pooling + "' (choose from " + ", ".join(pipeline.POOLINGS) + ")")
+            
+        if pooling not in strategies:
+            strategies.append(pooling)
+            
+    return strategies
+
+
+#Get the prefix of the BoV outputs of a pooling strategy (the mean keeps the original names, e.g. "bov_cat-pol_ng1" and "bov-max_cat-pol_ng1"):
+def pooling_path(output_dir, pooling):
+    return output_dir + ("bov" if pooling == "mean" else "bov-" + pooling) + "_cat-pol_ng"
+
+
+#Get the header of a TAB BoV output (number of documents and dimensions, then the attribute names):
+def bov_header(num_documents, dim):
+    return str(num_documents) + " " + str(dim) + "\n" + "".join("d" + str(d) + "\t" for d in range(1, dim+1)) + "class_atr\n"
+
+
+#Read the tokens of a document: a tokenized file, or a record (id, class, text) of a packed corpus:
+def document_tokens(document):
+    if isinstance(document, tuple):
+        return pipeline.text_tokens(document[2])
+    
+    return pipeline.read_tokens(document)
+
+
+#Read the tokens of a document in windows of at most "window" tokens (see pipeline.token_windows):
+def document_token_windows(document, window):
+    if isinstance(document, tuple):
+        return pipeline.token_windows([document[2]], window)
+    
+    return pipeline.token_windows(pipeline.read_pieces(document), window)
+
+
+#Get the window (tokens read and encoded at a time) that fits a memory budget (MB): per token, its N-grams (string,
+#rows) and, for each order, a float64 vector (a gathered row and its partial sum) of the model dimension:
+def memory_window(memory, n_gram, dim):
+    return max(n_gram, int(memory*1048576 // (n_gram*(16*dim+64)+256)))
+
+
+#Get the class of a document: the name of its file directory, or the class of its record:
+def document_class(document):
+    if isinstance(document, tuple):
+        return document[1]
+    
+    return document.split('/')[-2].strip()
+
+
+#Get the batches of documents of the input: lists of files, or lists of records of a packed corpus (read again on each call):
+def corpus_batches():
+    if packed:
+        records = pipeline.read_packed(args.input)
+        return iter(lambda: list(itertools.islice(records, args.batch)), [])
+    
+    return [files_list[batch_start:batch_start+args.batch] for batch_start in range(0, total_num_examples, args.batch)]
+
+
+#Add the time (seconds) since start to the latencies of the documents of a batch, if they are measured:
+def record_latency(latencies, start):
+    if latencies is not None:
+        latencies.append(time.time()-start)
+
+
+#Run a task on a batch, also returning the batch size and the latency of each document - process pool task (the batches may come from a stream):
+def sized_task(batch_files, task):
+    """
+    Each document is timed while it is read and its N-grams are looked up
+    (see record_latency); the work done for the whole batch at once
+    (gathering, summing, formatting) is split evenly among its documents.
+    """
+    latencies = []
+    start = time.time()
+    result = task(batch_files, latencies=latencies)
+    shared = max(time.time()-start-sum(latencies), 0.0) / max(len(batch_files), 1)
+    return len(batch_files), result, [latency + shared for latency in latencies]
+
+
+#Map a task over the batches of the input (in the workers, if any), yielding the size of each batch, its result and the latency of each document:
+def map_corpus(task):
+    return map_batches(functools.partial(sized_task, task=task), corpus_batches())
+
+
+#Collect all N-grams (joined by "_") that the corpus can produce, up to N (reading the documents in windows of tokens, if any):
+def scan_corpus(batches, n_gram, window=None):
+    words = set()
+    
+    for batch_files in batches:
+        for file_item in batch_files:
+            if window is None:
+                words.update("_".join(ng) for ng in nltk.everygrams(document_tokens(file_item), max_len=n_gram))
+                continue
+                
+            for tokens, starts in pipeline.carry_windows(document_token_windows(file_item, window), n_gram):
+                words.update("_".join(tokens[i:i+n]) for i in range(starts) for n in range(1, n_gram+1) if i+n <= len(tokens))
+                
+    return words
+
+
+#Get the rows found in a batch of documents read in windows of tokens, as chunks (document index, rows up to N, rows of each order):
+def window_chunks(batch_files, n_gram, window, latencies=None):
+    for index, file_item in enumerate(batch_files):
+        start = time.time()    #Also the time its chunks take to be summed (while this generator waits).
+        
+        for rows, order_rows in encoder.find_rows_windows(document_token_windows(file_item, window), n_gram):
+            yield index, rows, order_rows
+            
+        record_latency(latencies, start)
+
+
+#Get the chunks (document index, [rows up to N]) of a batch of documents read in windows, adding to found[0] the rows of order N:
+def window_rows(batch_files, n, window, found, latencies=None):
+    for index, rows, order_rows in window_chunks(batch_files, n, window, latencies):
+        found[0] += len(order_rows[-1])
+        yield index, [rows]
+
+
+#Get the rows of each order found in the documents of a batch (each document timed, see record_latency):
+def documents_order_rows(batch_files, n_gram, latencies=None):
+    documents = []
+    
+    for file_item in batch_files:
+        start = time.time()
+        documents.append(encoder.find_rows(document_tokens(file_item), n_gram)[1])
+        record_latency(latencies, start)
+        
+    return documents
+
+
+#Format a batch of document vectors (one TAB row per document, the whole batch at once):
+def format_batch(batch_labels, doc_vectors, found, precision=None):
+    rows = pipeline.format_rows(doc_vectors, batch_labels, found, precision)
+    
+    #Round-trip check of the first row of the batch (the values read back are within the precision):
+    if len(batch_labels) > 0:
+        pipeline.check_row(rows[:rows.index("\n")], doc_vectors[0], precision)
+        
+    return rows
+
+
+#Output a batch of documents pooled with each strategy (vectors of each pooling, vectors found): TAB rows, or (binary) float32 blocks of matrix rows:
+def output_batch(batch_labels, batch_vectors, counts, binary, precision=None):
+    return [doc_vectors.astype(numpy.float32) if binary else format_batch(batch_labels, doc_vectors, counts != 0, precision) for doc_vectors in batch_vectors]
+
+
+#Pool a batch of documents with each strategy from their sums, counts and maxima/minima (see pipeline.pool_batch), as output_batch:
+def pooled_batch(batch_labels, pooled, binary, precision=None, strategies=("mean",)):
+    return output_batch(batch_labels, [pipeline.pool_batch(pooling, *pooled) for pooling in strategies], pooled[1], binary, precision)
+
+
+#Encode a batch of files (everygrams up to N) as TAB rows (or binary matrix rows) of each pooling, also telling if any N-gram of order N was found:
+def encode_files(batch_files, n, binary=False, precision=None, window=None, strategies=("mean",), latencies=None):
+    """
+    Uses the global encoder (model and phrase index): process pool workers are forked
+    after it is loaded, so they share it read-only instead of receiving a copy.
+    If no N-gram of order N is found, the rows are the same as for N-1.
+    If window, the files are read and summed a window of tokens at a time.
+    Every pooling comes from the same gathered vectors (one pass).
+    """
+    batch_labels = [document_class(file_item) for file_item in batch_files]
+    if window is not None:
+        n_found = [0]
+        pooled = [values[0] for values in pipeline.sum_chunks(window_rows(batch_files, n, window, n_found, latencies), len(batch_files), encoder.matrix, window, extremes=pipeline.needs_extremes(strategies))]
+        return pooled_batch(batch_labels, pooled, binary, precision, strategies), n_found[0] > 0
+        
+    documents_rows = []
+    n_found = 0
+    
+    for file_item in batch_files:
+        start = time.time()
+        rows, order_rows = encoder.find_rows(document_tokens(file_item), n)
+        documents_rows.append(rows)
+        n_found += len(order_rows[-1])
+        record_latency(latencies, start)
+        
+    #All vectors found, pooled with each strategy (gathered once):
+    batch_vectors, counts = encoder.pool_batch(documents_rows, strategies)
+    return output_batch(batch_labels, batch_vectors, counts, binary, precision), n_found > 0
+
+
+#Encode a batch of files as TAB rows (or binary matrix rows) of each pooling for every N (from 1 to N) reading each file once:
+def encode_files_single_pass(batch_files, n_gram, binary=False, precision=None, window=None, strategies=("mean",), latencies=None):
+    extremes = pipeline.needs_extremes(strategies)
+    
+    if window is not None:
+        chunks = ((index, order_rows) for index, rows, order_rows in window_chunks(batch_files, n_gram, window, latencies))
+        order_pooled = pipeline.sum_chunks(chunks, len(batch_files), encoder.matrix, window, n_gram, extremes)
+    else:
+        batch_order_rows = documents_order_rows(batch_files, n_gram, latencies)
+        
+    batch_labels = [document_class(file_item) for file_item in batch_files]
+    doc_sums = numpy.zeros((len(batch_files), encoder.dim))
+    counts = numpy.zeros(len(batch_files), dtype=numpy.int64)
+    doc_extremes = (numpy.zeros(doc_sums.shape), numpy.zeros(doc_sums.shape)) if extremes else ()
+    outputs = []
+    
+    #Everygrams up to N = everygrams up to N-1 + N-grams (sum, count and maxima/minima are cumulative):
+    for n in range(1, n_gram+1):
+        if window is not None:
+            n_pooled = [values[n-1] for values in order_pooled]
+        else:
+            n_pooled = encoder.sum_batch([order_rows[n-1] for order_rows in batch_order_rows], extremes)
+            
+        n_sums, n_counts = n_pooled[0], n_pooled[1]
+        found = n_counts > 0
+        doc_sums[found] += n_sums[found]    #Rows without N-grams found stay exactly the same as for N-1.
+        
+        for doc_values, n_values, reduce in zip(doc_extremes, n_pooled[2:], (numpy.maximum, numpy.minimum)):
+            doc_values[found] = numpy.where(counts[found][:, None] > 0, reduce(doc_values[found], n_values[found]), n_values[found])
+            
+        counts += n_counts
+        outputs.append( (pooled_batch(batch_labels, (doc_sums, counts) + doc_extremes, binary, precision, strategies), found.any()) )
+        
+    return outputs
+
+
+#Count the N-grams of each order (1 to N) of a batch of files, as sparse Doc-Term count matrices (TF-IDF weighting):
+def count_files(batch_files, n_gram, window=None, latencies=None):
+    if window is not None:
+        chunks = ((index, order_rows) for index, rows, order_rows in window_chunks(batch_files, n_gram, window, latencies))
+        return pipeline.count_chunks(chunks, len(batch_files), encoder.matrix.shape[0], n_gram)
+        
+    batch_order_rows = documents_order_rows(batch_files, n_gram, latencies)
+    return [pipeline.count_matrix([order_rows[n] for order_rows in batch_order_rows], encoder.matrix.shape[0]) for n in range(n_gram)]
+
+
+#Open a BoV output: a TAB file, or (binary) a float32 matrix (".npy", one row per document) and its labels index (".labels"):
+def open_output(out_path, header, labels, model_dim, binary):
+    if binary:
+        labels_file = codecs.open(out_path + ".labels", "w", "utf-8")
+        labels_file.write("".join(class_atr + "\n" for class_atr in labels))
+        labels_file.close()
+        
+        if os.path.exists(out_path + ".npy"):
+            os.remove(out_path + ".npy")    #May be hard-linked to other matrices (bag2bag.py --link): not rewritten in place.
+            
+        return numpy.lib.format.open_memmap(out_path + ".npy", mode="w+", dtype=numpy.float32, shape=(len(labels), model_dim))
+    
+    out_file = open(out_path, "w")
+    out_file.write(header)
+    return out_file
+
+
+#Write a batch (TAB rows or matrix rows, starting at row_i) to a BoV output:
+def write_output(output, rows, row_i):
+    if isinstance(output, numpy.ndarray):
+        output[row_i:row_i+len(rows)] = rows
+    else:
+        output.write(rows)
+        
+        
+#Open a BoV output as a copy of the first rows of another output (saved or open), to keep writing it from num_rows on:
+def open_output_copy(out_path, source_path, source, header, labels, model_dim, binary, num_rows):
+    output = open_output(out_path, header, labels, model_dim, binary)
+    
+    if binary:
+        source_matrix = source if source is not None else numpy.load(source_path + ".npy", mmap_mode="r")
+        output[:num_rows] = source_matrix[:num_rows]
+        del source_matrix
+    else:
+        if source is not None:
+            source.flush()
+            
+        source_file = open(source_path, "r")
+        source_file.readline()    #Header lines (already written).
+        source_file.readline()
+        
+        for row in range(num_rows):
+            output.write(source_file.readline())
+            
+        source_file.close()
+        
+    return output
+
+
+#Open the BoV outputs of order N, one per pooling (prefix, header and dimension of each pooling):
+def open_outputs(out_strings, n, headers, labels, dims, binary):
+    return [open_output(out_string + str(n), header, labels, dim, binary) for out_string, header, dim in zip(out_strings, headers, dims)]
+
+
+#Open the BoV outputs of order N as copies of the first rows of the outputs of order M (saved, or open: sources), one per pooling:
+def open_outputs_copy(out_strings, n, m, sources, headers, labels, dims, binary, num_rows):
+    sources = sources if sources is not None else [None]*len(out_strings)
+    return [open_output_copy(out_string + str(n), out_string + str(m), source, header, labels, dim, binary, num_rows) for out_string, source, header, dim in zip(out_strings, sources, headers, dims)]
+
+
+#Close a BoV output:
+def close_output(output):
+    if isinstance(output, numpy.ndarray):
+        output.flush()
+    else:
+        output.close()
+
 ################################################################################
         
         
@@ -89,16 +364,33 @@ def natural(v):
 
 #Run:
 #python3 text2bov.py --n_gram 1 --model models/Google/GoogleVectors_300.txt --input input/dataset/tokenized/ --output output/bov/txt/
+#python3 text2bov.py --n_gram 1 --model models/Google/GoogleVectors_300.txt --input input/dataset_tokenized.jsonl --output output/bov/txt/
 
 #Pre-trained word and phrase vectors (Google): https://drive.google.com/file/d/0B7XkCwpI5KDYNlNUTTlSS21pQmM/edit?usp=sharing
 #More info: https://code.google.com/archive/p/word2vec/
 
+REPORT_DOCUMENTS = 1000    #Sample of the quantization report.
+
 #Defining script arguments: 
 parser = argparse.ArgumentParser(description="Create a Bag of Vectors based in a W2V model (text vectors).")
 parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
 parser.add_argument("--n_gram", metavar='NUM', type=natural, action="store", dest="n_gram", default=1, nargs="?", const=True, required=False, help='specify N-gram - def. 1')
-parser.add_argument("--model", "-m", metavar='PATH', type=str, action="store", dest="model", required=True, nargs="?", const=True, help='input file_input of model (Word2Vec text vectors)')
-parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of files to test')
+parser.add_argument("--model", "-m", metavar='PATH', type=str, action="store", dest="model", required=False, nargs="?", const=True, help='input file_input of model (Word2Vec text vectors or binary ".npy" model)')
+parser.add_argument("--attach", metavar='NAME', type=str, action="store", dest="attach", required=False, nargs="?", const=True, help='name of a model shared by model2shm.py, attached instead of loading --model')
+parser.add_argument("--pooling", metavar='LIST', type=poolings, action="store", dest="pooling", default="mean", nargs="?", const="mean", required=False, help='comma-separated pooling strategies of the vectors, all from the same pass, one output each: "mean", "max", "min", "sum" or "mean+max" (concatenated) - def. mean')
+parser.add_argument("--weighting", metavar='NAME', type=str, action="store", dest="weighting", default="mean", choices=["mean", "tfidf"], nargs="?", const="mean", required=False, help='weighting of the vectors: "mean" (arithmetic mean) or "tfidf" (mean weighted by TF x smoothed IDF of the corpus, from sparse Doc-Term matrices; the texts are read once) - def. mean')
+parser.add_argument("--batch", metavar='NUM', type=natural, action="store", dest="batch", default=100, nargs="?", const=True, required=False, help='number of documents encoded per matrix operation - def. 100')
+parser.add_argument("--single_pass", metavar='BOOL', type=str2bool, action="store", dest="single_pass", nargs="?", const=True, default=False, required=False, help='read each file once and create all N-gram outputs from cumulative sums (values may differ in the last digits) - def. False')
+parser.add_argument("--workers", metavar='NUM', type=natural, action="store", dest="workers", default=1, nargs="?", const=True, required=False, help='number of worker processes to encode the documents - def. 1')
+parser.add_argument("--vocab_filter", metavar='BOOL', type=str2bool, action="store", dest="vocab_filter", nargs="?", const=True, default=False, required=False, help='scan the input texts and load only the vectors of their N-grams - def. False')
+parser.add_argument("--submodel", metavar='PATH', type=str, action="store", dest="submodel", required=False, nargs="?", const=True, help='file of filtered sub-model (binary ".npy" model): loaded if it exists for the same corpus, model and N-gram (skipping the scan), otherwise saved after the scan (implies --vocab_filter)')
+parser.add_argument("--quantize", metavar='NAME', type=str, action="store", dest="quantize", choices=["float16", "int8"], nargs="?", const="int8", required=False, help='keep the model in reduced precision: "float16" or "int8" (rows quantized with a scale factor each) - vectors are still summed in float64')
+parser.add_argument("--quantize_report", metavar='BOOL', type=str2bool, action="store", dest="quantize_report", nargs="?", const=True, default=False, required=False, help='compare the mean vectors of the first ' + str(REPORT_DOCUMENTS) + ' documents with full precision (max/mean deviation) - def. False')
+parser.add_argument("--binary", metavar='BOOL', type=str2bool, action="store", dest="binary", nargs="?", const=True, default=False, required=False, help='save the BoV as a float32 matrix (".npy") and a labels index (".labels") instead of TAB text - def. False')
+parser.add_argument("--precision", metavar='NUM', type=natural, action="store", dest="precision", nargs="?", const=True, required=False, help='number of decimals of the TAB values (fixed-point, checked by reading back a row of each batch) - def. full precision (repr)')
+parser.add_argument("--memory", metavar='MB', type=natural, action="store", dest="memory", nargs="?", const=True, required=False, help='memory budget (MB) per process to read and encode a document: long documents are read and summed in windows of tokens (same output) - def. whole documents')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of files to test (or packed corpus: ".jsonl", ".tar", ".tar.gz" - rows in the order of its records)')
 parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save the BoV')
 args = parser.parse_args()    #Verifying arguments.
 
@@ -112,7 +404,7 @@ if args.log:
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
 print("")
-total_start = time.time()
+run = instrumentation.Run("text2bov", vars(args))
 
 ################################################################################
 
@@ -126,100 +418,276 @@ if not os.path.exists(args.input):
     print("\t!Directory: " + args.input) 
     sys.exit()
 
-model = open(args.model, "r")
-model.readline()
-vectors = {}
-model_dim = 0
+print("> Loading input texts...\n")
+packed = pipeline.is_packed(args.input)
 
-#Loading model as an indexed dictionary:
-for vector in model:
-    data = vector.strip().split(' ')
-    head = data[0].strip()
-    data.pop(0)
-    vectors[head] = [float(elt) for elt in data]
-    model_dim = len(data)
+#Loading all files from all root directories (a packed corpus is read as a stream, on each pass; first, its classes):     
+if packed:
+    files_list = []
+    labels = [class_atr for doc_id, class_atr, text in pipeline.read_packed(args.input)]
+else:
+    files_list = pipeline.list_corpus(args.input)
+    labels = [document_class(file_item) for file_item in files_list]
+    
+total_num_examples = len(labels)
 
-################################################################################
+if not args.model and not args.attach:
+    print("ERROR: a model (--model) or a shared model (--attach) is required!")
+    sys.exit()
+    
+if args.attach and (args.quantize or args.vocab_filter or args.submodel):
+    print("ERROR: a shared model is used as served (no --quantize, --vocab_filter or --submodel)!")
+    sys.exit()
+    
+if args.weighting == "tfidf" and scipy is None:
+    print("ERROR: TF-IDF weighting requires SciPy!")
+    sys.exit()
+    
+if args.weighting == "tfidf" and pipeline.needs_extremes(args.pooling):
+    print("ERROR: TF-IDF weighting is only pooled as \"mean\" or \"sum\" (weighted)!")
+    sys.exit()
 
-print("> Loading input texts...\n")
-files = []
-files_list = []
- 
-#Loading all files from all root directories:     
-for directory in os.listdir(args.input):
-    for file_item in os.listdir(args.input + "/" + directory):
-        files_list.append(args.input + directory + "/" + file_item)
-              
-files_list.sort()
-total_num_examples = len(files_list)
+if args.submodel and not args.submodel.endswith(".npy"):
+    args.submodel += ".npy"
+    
+#A sub-model is only reused for the corpus, model and N (or a lower N) it was filtered for; otherwise it is rebuilt:
+if args.submodel:
+    submodel_meta = {"input": os.path.abspath(args.input), "corpus": pipeline.corpus_fingerprint(args.input), "model": os.path.abspath(args.model), "n_gram": args.n_gram}
+    saved_meta = pipeline.load_meta(args.submodel) if os.path.exists(args.submodel) else None
+    reuse_submodel = saved_meta is not None and saved_meta.get("n_gram", 0) >= args.n_gram and all(saved_meta.get(key) == submodel_meta[key] for key in ("input", "corpus", "model"))
+    
+    if os.path.exists(args.submodel) and not reuse_submodel:
+        print("WARNING: sub-model filtered for another corpus, model or N-gram (rebuilding it)!")
+        print("\t!File: " + args.submodel + "\n")
 
-################################################################################
+#Loading model as an indexed dictionary (word -> matrix row) and the phrase index (N > 1):
+if args.attach:
+    print("> Attaching shared model...\n")
+    stage = run.stage("model loading", 1, progress=False)
+    
+    try:
+        encoder = pipeline.BoVEncoder(shared=args.attach)
+    except FileNotFoundError:
+        print("ERROR: shared model not found (see model2shm.py)!")
+        print("\t!Name: " + args.attach)
+        sys.exit()
+elif args.submodel and reuse_submodel:
+    print("> Loading sub-model (corpus scan skipped)...\n")
+    stage = run.stage("model loading", 1, progress=False)
+    model_path = args.submodel
+    encoder = pipeline.BoVEncoder(model_path, phrases=args.n_gram > 1, quantize=args.quantize)
+elif args.vocab_filter or args.submodel:
+    print("> Scanning input texts...\n")
+    stage = run.stage("corpus scan", total_num_examples, progress=False)
+    corpus_words = scan_corpus(corpus_batches(), args.n_gram, memory_window(args.memory, args.n_gram, 0) if args.memory else None)
+    stage.update(total_num_examples)
+    stage.finish()
+    print("> Loading model (" + str(len(corpus_words)) + " corpus N-grams)...\n")
+    stage = run.stage("model loading", 1, progress=False)
+    model_path = args.model
+    encoder = pipeline.BoVEncoder(model_path, corpus_words, phrases=args.n_gram > 1, quantize=None if args.submodel else args.quantize)
+    del corpus_words
+    
+    if args.submodel:
+        pipeline.save_model(args.submodel, encoder.vocabulary, encoder.matrix, submodel_meta)    #Saved in full precision.
+        encoder.quantize(args.quantize)
+else:
+    print("> Loading model...\n")
+    stage = run.stage("model loading", 1, progress=False)
+    model_path = args.model
+    encoder = pipeline.BoVEncoder(model_path, phrases=args.n_gram > 1, quantize=args.quantize)
+    
+stage.update()
+stage.finish()
+model_dim = encoder.dim
+window = memory_window(args.memory, args.n_gram, model_dim) if args.memory else None
 
-out_string = args.output + "bov_cat-pol_ng"
-header = str(total_num_examples) + " " + str(model_dim) + "\n"
+################################################################################
 
-for dim in range(1, model_dim+1):
-    header += "d" + str(dim) + "\t"
-    
-header += "class_atr\n"
+#One output per pooling ("mean+max": mean and maxima concatenated, twice the dimension):
+out_strings = [pooling_path(args.output, pooling) for pooling in args.pooling]
+dims = [2*model_dim if pooling == "mean+max" else model_dim for pooling in args.pooling]
+headers = [bov_header(total_num_examples, dim) for dim in dims]
 print("> TASK 1 - N-GRAM VARIATION / TASK 2 - TEXT REPRESENTATION:")
 print("..................................................")
-total_operations = args.n_gram*total_num_examples
-filepath_i = 0
-eta = 0
-print_progress(filepath_i, total_operations, eta)
-operation_start = time.time()
+total_operations = args.n_gram*total_num_examples + (total_num_examples if args.weighting == "tfidf" else 0)    #TF-IDF: + counting.
+stage = run.stage("encoding", total_operations)
 
-for n in range(1, args.n_gram+1):
-    out_file = open(out_string + str(n), "w")
-    out_file.write(header)    
+#Workers are forked after loading the model (shared read-only); imap keeps the batches in order (a stream is read a window at a time):
+if args.workers > 1:
+    pool = multiprocessing.get_context("fork").Pool(args.workers)
+    map_batches = functools.partial(pipeline.imap_window, pool, window=4*args.workers) if packed else pool.imap
+else:
+    map_batches = map
+
+row_i = 0
+
+skipped = []
+
+#An output of order N is only opened when order N adds vectors (before that it is the same as N-1); then its
+#first rows are copied from the last output opened. Outputs never opened are duplicated, so they are not saved:
+if args.weighting == "tfidf":
+    #Reading the texts once: a sparse Doc-Term count matrix per order (everygrams up to N = orders 1 to N summed):
+    order_counts = [[] for n in range(args.n_gram)]
     
-    for file_item in files_list:
-        start = time.time()
-        words = []
-        file_input = codecs.open(file_item, "r", "UTF-8")
-        doc_vector = [0]*model_dim
-        vectors_found = 0
-        n_grams = list( nltk.everygrams(" ".join( [l.strip() for l in file_input.readlines()] ).split(" "), max_len=n) )
-        
-        for ng in n_grams:
-            words.append("_".join(ng))
+    for batch_size, batch_counts, latencies in map_corpus(functools.partial(count_files, n_gram=args.n_gram, window=window)):
+        for n_i, counts in enumerate(batch_counts):
+            order_counts[n_i].append(counts)
+            
+        stage.update(batch_size, latencies)
+        
+    order_counts = [scipy.sparse.vstack(counts, format="csr") if counts else scipy.sparse.csr_matrix((0, encoder.matrix.shape[0])) for counts in order_counts]    #No documents: empty matrices.
+    counts = order_counts[0]
+    
+    for n in range(2, args.n_gram+1):
+        counts = counts + order_counts[n-1]
+        
+    idf = pipeline.idf_weights(counts)    #The N-grams of each order are different terms (same IDF for every N).
+    counts = None
+    
+    for n in range(1, args.n_gram+1):
+        counts = order_counts[0] if n == 1 else counts + order_counts[n-1]
+        
+        if n > 1 and order_counts[n-1].nnz == 0:
+            skipped.append(n)
+            stage.update(total_num_examples)
+            continue
+            
+        weights = counts.multiply(idf).tocsr()
+        outputs = open_outputs(out_strings, n, headers, labels, dims, args.binary)
+        
+        #All document vectors from sparse x dense products (in batches of documents):
+        for batch_start in range(0, total_num_examples, args.batch):
+            doc_sums, doc_weights = encoder.weighted_sum_batch(weights[batch_start:batch_start+args.batch])
+            batch_rows = pooled_batch(labels[batch_start:batch_start+args.batch], (doc_sums, doc_weights), args.binary, args.precision, args.pooling)
+            
+            for output, rows in zip(outputs, batch_rows):
+                write_output(output, rows, batch_start)
+                
+            stage.update(len(doc_weights))
             
-        file_input.close()
-        class_atr = file_item.split('/')[-2].strip()
-        
-        #Sum all vectors found:
-        for word in words:
-            if word in vectors:
-                doc_vector = [sum(x) for x in zip(*[doc_vector, vectors[word]])]
-                vectors_found += 1
+        for output in outputs:
+            close_output(output)
+        
+    del order_counts, counts
+elif args.single_pass:
+    outputs = [open_outputs(out_strings, 1, headers, labels, dims, args.binary)] + [None]*(args.n_gram-1)    #Outputs of each order (one per pooling).
+    
+    for batch_size, batch_outputs, latencies in map_corpus(functools.partial(encode_files_single_pass, n_gram=args.n_gram, binary=args.binary, precision=args.precision, window=window, strategies=args.pooling)):
+        for n_i, (batch_rows, found) in enumerate(batch_outputs):
+            if outputs[n_i] is None and found:
+                m_i = max(i for i in range(n_i) if outputs[i] is not None)
+                outputs[n_i] = open_outputs_copy(out_strings, n_i+1, m_i+1, outputs[m_i], headers, labels, dims, args.binary, row_i)
                 
-        #Dividing (arithmetic mean) final vector:        
-        if vectors_found != 0:
-            doc_vector = [x / vectors_found for x in doc_vector]
+            if outputs[n_i] is not None:
+                for output, rows in zip(outputs[n_i], batch_rows):
+                    write_output(output, rows, row_i)
             
-        out_file.write( "\t".join(str(e) for e in doc_vector) + "\t" + class_atr + "\n" )
-        filepath_i += 1
-        end = time.time()
-        eta = (total_operations-filepath_i)*(end-start)
-        print_progress(filepath_i, total_operations, eta)
+        row_i += batch_size
+        stage.update(batch_size*args.n_gram, latencies)    #Latency per document (all orders).
+        
+    for n_i, order_outputs in enumerate(outputs):
+        if order_outputs is None:
+            skipped.append(n_i+1)
+        else:
+            for output in order_outputs:
+                close_output(output)
+        
+    del outputs
+else:
+    last_saved = 1
+    
+    for n in range(1, args.n_gram+1):
+        outputs = open_outputs(out_strings, n, headers, labels, dims, args.binary) if n == 1 else None    #One per pooling.
+        order_stage = run.stage("encoding ng" + str(n), total_num_examples, progress=False)    #Metrics per order.
+        row_i = 0
+        
+        for batch_size, (batch_rows, found), latencies in map_corpus(functools.partial(encode_files, n=n, binary=args.binary, precision=args.precision, window=window, strategies=args.pooling)):
+            if outputs is None and found:
+                outputs = open_outputs_copy(out_strings, n, last_saved, None, headers, labels, dims, args.binary, row_i)
+                
+            if outputs is not None:
+                for output, rows in zip(outputs, batch_rows):
+                    write_output(output, rows, row_i)
+                
+            row_i += batch_size
+            stage.update(batch_size, latencies)
+            order_stage.update(batch_size, latencies)
+                
+        order_stage.finish()
+        
+        if outputs is None:
+            skipped.append(n)
+        else:
+            for output in outputs:
+                close_output(output)
+                
+            last_saved = n
             
-    out_file.close()
+        del outputs
+        
+if args.workers > 1:
+    pool.close()
+    pool.join()
     
-operation_end = time.time()
-eta = operation_end-operation_start
-print_progress(total_operations, total_operations, eta, final=True)    
+stage.finish()
 print("..................................................\n")
     
 ################################################################################    
     
-#Comparing output files:
+#Duplicated output files (no N-gram of order N found): not saved, and the same output of an earlier run removed:
 print("> Removing duplicated files:")
 print("..................................................")
+out_extension = ".npy" if args.binary else ""
 
-for i in reversed(range(2, args.n_gram+1)):     
-    if (filecmp.cmp(out_string + str(i), out_string + str(i-1), shallow=False)):
-        os.remove(out_string + str(i))
-        print(out_string + str(i) + " \t\t\t--> REMOVED")
+for i in skipped:     
+    for out_string in out_strings:
+        for out_path in ([out_string + str(i) + ".npy", out_string + str(i) + ".labels"] if args.binary else [out_string + str(i)]):
+            if os.path.exists(out_path):
+                os.remove(out_path)
+                
+        print(out_string + str(i) + out_extension + " \t\t\t--> REMOVED")
         
 print("..................................................\n")
+
+################################################################################
+
+
+################################################################################
+
+#Deviation of the document vectors (mean) from reduced precision, against the full precision vectors of their N-grams:
+if args.quantize and args.quantize_report:
+    print("> Quantization report (" + args.quantize + "):")
+    print("..................................................")
+    sample = list(itertools.islice((file_item for batch_files in corpus_batches() for file_item in batch_files), REPORT_DOCUMENTS))
+    sample_tokens = [document_tokens(file_item) for file_item in sample]
+    sample_words = scan_corpus([sample], args.n_gram)
+    reference = pipeline.BoVEncoder(model_path, sample_words, phrases=args.n_gram > 1)
+    doc_vectors = encoder.encode_batch(sample_tokens, args.n_gram)[0]
+    reference_vectors = reference.encode_batch(sample_tokens, args.n_gram)[0]
+    deviation = numpy.abs(doc_vectors - reference_vectors)
+    norms = numpy.linalg.norm(doc_vectors, axis=1) * numpy.linalg.norm(reference_vectors, axis=1)
+    cosines = numpy.sum(doc_vectors * reference_vectors, axis=1)[norms > 0] / norms[norms > 0]
+    del reference
+    print("- Documents: " + str(len(sample)) + " (N-grams up to " + str(args.n_gram) + ")")
+    print("- Max deviation: " + "%.3e" % (deviation.max() if deviation.size else 0.0))
+    print("- Mean deviation: " + "%.3e" % (deviation.mean() if deviation.size else 0.0))
+    print("- Min cosine similarity: " + "%.9f" % (cosines.min() if cosines.size else 1.0))
+    print("..................................................\n")
+
+################################################################################
+
+
+################################################################################
+
+print("> Log:")
+print("..................................................")
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Files: " + str(total_num_examples))
+print("- Output files: " + str((args.n_gram-len(skipped))*len(args.pooling)) + " (pooling: " + ", ".join(args.pooling) + ")")
+if window is not None:
+    print("- Window: " + str(window) + " tokens (memory budget: " + str(args.memory) + " MB)")
+    
+print("- Model: " + "%.1f" % (encoder.matrix.nbytes / 1048576.0) + " MB (" + (args.quantize or str(encoder.matrix.dtype)) + (", shared: " + args.attach if args.attach else "") + ")")
+print("..................................................\n")
+run.save(args.metrics)
@@ -10,54 +10,20 @@
 ################################################################################
 
 from __future__ import print_function
-import time
-import datetime
 import codecs
+import instrumentation
 import logging
 import os
+import pipeline
 import sys
 import argparse
-import math
+import numpy
 
 
 ################################################################################
 ### FUNCTIONS                                                                ###
 ################################################################################
 
-# Print iterations progress: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
-def print_progress(iteration, total, estimation, prefix='Progress:', decimals=1, bar_length=100, final=False):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        estimation  - Required  : iteration estimation in seconds (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        bar_length  - Optional  : character length of bar (Int)
-    """
-    rows, columns = os.popen('stty size', 'r').read().split()
-    eta = str( datetime.timedelta(seconds=max(0, int( math.ceil(estimation) ))) )
-    bar_length = int(columns)-len(prefix)-len(eta)-15
-    str_format = "{0:." + str(decimals) + "f}"
-    percents = str_format.format(100 * (iteration / float(total)))
-    filled_length = int(round(bar_length * iteration / float(total)))
-    bar = '█' * filled_length + '-' * (bar_length - filled_length)
-    sys.stdout.write('\r%s |%s| %s%s ETA %s' % (prefix, bar, percents, '%', eta))
-
-    if final == True:    #iteration == total
-        sys.stdout.write('\n')
-        
-    sys.stdout.flush()
-    del rows
-    
-
-#Format a value in seconds to "day, HH:mm:ss".
-def format_time(seconds):
-    return str( datetime.timedelta(seconds=max(0, int( math.ceil(seconds) ))) )
-
-
 #Convert a string value to boolean:
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
@@ -93,19 +59,90 @@ def percentage(v):
     except ValueError:
         raise argparse.ArgumentTypeError("invalid percentage number value: " + "'" + v + "'")    
     
+
+#Read a Doc-Term file header, returning the number of dimensions and the first data line (if the file has no names line):
+def read_header(file_item):
+    n = int( file_item.readline().split(" ")[1] )
+    line = file_item.readline()
+    
+    if line.startswith("d1\t") and line.rstrip("\n").endswith("class_atr"):    #Names line (d1 ... dN class_atr).
+        line = ""
+        
+    return n, line
+
+
+#Collect the classes (last column) of a Doc-Term file, streaming it line by line:
+def scan_classes(filepath):
+    file_item = codecs.open(filepath, "r", "utf-8")
+    n, line = read_header(file_item)
+    classes = set()
+    
+    if line:
+        classes.add(line.rstrip("\n").rsplit("\t", 1)[-1])
+        
+    for line in file_item:
+        classes.add(line.rstrip("\n").rsplit("\t", 1)[-1])
+        
+    file_item.close()
+    return sorted(classes)
+
+
+#Write a Doc-Term file (TAB) as an ARFF with numeric attributes "d1..dN" and a nominal "class_atr":
+def write_arff(filepath, arff_path, classes):
+    """
+    Values are copied as they are in the Doc-Term file (no float parsing),
+    one line at a time, so memory does not depend on the file size.
+    """
+    file_item = codecs.open(filepath, "r", "utf-8")
+    n, line = read_header(file_item)
+    arff = pipeline.ArffWriter(arff_path, filepath.split("/")[-1], n, classes)
+    
+    if line:
+        values, class_atr = line.rstrip("\n").rsplit("\t", 1)
+        arff.write(values.replace("\t", ","), class_atr)
+        
+    for line in file_item:
+        values, class_atr = line.rstrip("\n").rsplit("\t", 1)
+        arff.write(values.replace("\t", ","), class_atr)
+        
+    file_item.close()
+    arff.close()
+    
+    
+#Read the labels index of a binary Doc-Term file (".npy" matrix + ".labels"):
+def read_labels(filepath):
+    labels_file = codecs.open(os.path.splitext(filepath)[0] + ".labels", "r", "utf-8")
+    labels = [class_atr.rstrip("\n") for class_atr in labels_file]
+    labels_file.close()
+    return labels
+
+
+#Write a binary Doc-Term file (float32 ".npy" matrix + ".labels") as an ARFF, reading the matrix memory-mapped (no parsing):
+def write_arff_binary(filepath, arff_path, classes):
+    matrix = numpy.load(filepath, mmap_mode="r")
+    arff = pipeline.ArffWriter(arff_path, os.path.splitext(filepath.split("/")[-1])[0], matrix.shape[1], classes)
+    
+    for row, class_atr in zip(matrix, read_labels(filepath)):
+        arff.write(row, class_atr)
+        
+    arff.close()
+    del matrix
+    
 ################################################################################
 
 
 ################################################################################
 
 #Run:
-#python3 bag2arff.py --weka weka.jar --input output/bov/txt/ --output output/bov/arff/
+#python3 bag2arff.py --input output/bov/txt/ --output output/bov/arff/
 
 #Defining script arguments: 
 parser = argparse.ArgumentParser(description="Convert a Doc-Term matrix to ARFF (Weka file).")
 parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
-parser.add_argument("--weka", metavar='PATH', type=str, action="store", dest="weka", required=True, nargs="?", const=True, help='file path to Weka jar API')
-parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of Doc-Term files')
+parser.add_argument("--weka", metavar='PATH', type=str, action="store", dest="weka", required=False, nargs="?", const=True, help='file path to Weka jar API (deprecated: ARFFs are written without Weka)')
+parser.add_argument("--classes", metavar='LIST', type=str, action="store", dest="classes", required=False, nargs="?", const=True, help='comma-separated values of "class_atr" (skips scanning the classes of each file)')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of Doc-Term files (TAB or binary ".npy" + ".labels")')
 parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save the ARFF files')
 args = parser.parse_args()    #Verifying arguments.
 
@@ -119,7 +156,7 @@ if args.log:
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
 print("")
-total_start = time.time()
+run = instrumentation.Run("bag2arff", vars(args))
 
 ################################################################################
 
@@ -133,52 +170,22 @@ if not os.path.exists(args.input):
     print("\t!Directory: " + args.input) 
     sys.exit()
      
-print("> Loading input files:")
-print("..................................................")
+print("> Loading input files...\n")
 files_list = []
  
 #Loading all files from root directory:     
 for file_item in os.listdir(args.input):
-    files_list.append(args.input + file_item)
+    if not file_item.endswith(".labels"):    #Labels index of a binary Doc-Term (".npy").
+        files_list.append(args.input + file_item)
               
 files_list.sort()
-filepath_i = 0
 total_num_examples = len(files_list)
-eta = 0
-print_progress(filepath_i, total_num_examples, eta)
-operation_start = time.time()
-             
-#Reading files:
-for filepath in files_list:
-    start = time.time()
-    file_item = codecs.open(filepath, "r", "utf-8")
-    tmp_file_item = codecs.open(filepath + ".tmp", "w", "utf-8")
-    n = int( file_item.readline().split(" ")[1] )
-    header = ""
-        
-    for d_i in range(1, n+1):
-        header += "d" + str(d_i) + "\t"
-       
-    header += "class_atr\n"
-    tmp_file_item.write(header)
-    tmp_file_item.writelines(file_item.readlines())
-    file_item.close()
-    tmp_file_item.close()
-    filepath_i += 1
-    end = time.time()
-    eta = (total_num_examples-filepath_i)*(end-start)
-    print_progress(filepath_i, total_num_examples, eta)
-     
-operation_end = time.time()
-eta = operation_end-operation_start
-print_progress(total_num_examples, total_num_examples, eta, final=True) 
-print("..................................................\n")
 
 ################################################################################
  
  
 ################################################################################
-### CONVERTING DOC-TERMs TO ARFFs                                                 ###
+### CONVERTING DOC-TERMs TO ARFFs                                            ###
 ################################################################################
  
 if not os.path.exists(args.output):
@@ -189,37 +196,24 @@ else:
      
 print("> Converting Doc-Terms to ARFFs:")
 print("..................................................")
-filepath_i = 0
-eta = 0
-print_progress(filepath_i, total_num_examples, eta) 
-operation_start = time.time()
+stage = run.stage("conversion", total_num_examples)
   
 #Reading files:
 for filepath in files_list:
-    start = time.time()
     file_name = filepath.split("/")[-1]
-    arff_path = args.output + file_name + '.arff'
-    os.system("java > /dev/null 2>&1 -classpath " + args.weka + " weka.core.converters.CSVLoader " + filepath  + ".tmp > " + arff_path + " -F '\t'")
-    os.remove(filepath + ".tmp")
-    arff_file = codecs.open(arff_path, "r", "utf-8")
-    arff_name = arff_file.readline()[:-5]    #Removing ".tmp" extension.
-    arff_content = arff_file.readlines()
-    arff_file.close()
-    arff_file = codecs.open(arff_path, "w", "utf-8")
-    arff_file.write(arff_name + "\n")
-    
-    for line in arff_content:
-        arff_file.write(line)
     
-    arff_file.close()
-    filepath_i += 1
-    end = time.time()
-    eta = (total_num_examples-filepath_i)*(end-start)
-    print_progress(filepath_i, total_num_examples, eta)
+    if filepath.endswith(".npy"):
+        arff_path = args.output + os.path.splitext(file_name)[0] + '.arff'
+        classes = args.classes.split(",") if args.classes else sorted(set(read_labels(filepath)))
+        write_arff_binary(filepath, arff_path, classes)
+    else:
+        arff_path = args.output + file_name + '.arff'
+        classes = args.classes.split(",") if args.classes else scan_classes(filepath)
+        write_arff(filepath, arff_path, classes)
+        
+    stage.update()
     
-operation_end = time.time()
-eta = operation_end-operation_start
-print_progress(total_num_examples, total_num_examples, eta, final=True)
+stage.finish()
 print("..................................................\n")
  
 ################################################################################
@@ -227,9 +221,9 @@ print("..................................................\n")
 
 ################################################################################
 
-total_end = time.time()
 print("> Log:")
 print("..................................................")
-print("- Time: " + str(format_time(total_end-total_start)))
+print("- Time: " + instrumentation.format_time(run.elapsed()))
 print("- Files: " + str(total_num_examples))
 print("..................................................\n")
+run.save(args.metrics)
@@ -10,54 +10,22 @@
 ################################################################################
 
 from __future__ import print_function
-import time
-import datetime
 import codecs
+import instrumentation
 import logging
 import os
+import pipeline
 import sys
 import argparse
-import math
+import multiprocessing
+import re
+import shutil
 
 
 ################################################################################
 ### FUNCTIONS                                                                ###
 ################################################################################
 
-# Print iterations progress: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
-def print_progress(iteration, total, estimation, prefix='Progress:', decimals=1, bar_length=100, final=False):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        estimation  - Required  : iteration estimation in seconds (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        bar_length  - Optional  : character length of bar (Int)
-    """
-    rows, columns = os.popen('stty size', 'r').read().split()
-    eta = str( datetime.timedelta(seconds=max(0, int( math.ceil(estimation) ))) )
-    bar_length = int(columns)-len(prefix)-len(eta)-15
-    str_format = "{0:." + str(decimals) + "f}"
-    percents = str_format.format(100 * (iteration / float(total)))
-    filled_length = int(round(bar_length * iteration / float(total)))
-    bar = '█' * filled_length + '-' * (bar_length - filled_length)
-    sys.stdout.write('\r%s |%s| %s%s ETA %s' % (prefix, bar, percents, '%', eta))
-
-    if final == True:    #iteration == total
-        sys.stdout.write('\n')
-        
-    sys.stdout.flush()
-    del rows
-    
-
-#Format a value in seconds to "day, HH:mm:ss".
-def format_time(seconds):
-    return str( datetime.timedelta(seconds=max(0, int( math.ceil(seconds) ))) )
-
-
 #Convert a string value to boolean:
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
@@ -93,16 +61,109 @@ def percentage(v):
     except ValueError:
         raise argparse.ArgumentTypeError("invalid percentage number value: " + "'" + v + "'")    
     
+
+#Get the class components names from a Doc-Term file name (e.g. "bov_cat-pol_ng1" -> "cat-pol", ["cat", "pol"]):
+def split_names(file_name):
+    match = re.search(r"_([^_]+(?:-[^_]+)+)_", file_name)
+    
+    if match is None:
+        return None, []
+    
+    return match.group(1), match.group(1).split("-")
+
+
+#Split a Doc-Term file (TAB or binary) in one Doc-Term file per class component, in a single streaming pass:
+def split_file(filepath, output_dir, split, names=None, link=False):
+    """
+    Each row is read once and written to every component file with its part of
+    "class_atr" (e.g. "catX-polY" -> "catX" in "_cat_" and "polY" in "_pol_").
+    Component names come from the file name ("_cat-pol_") or from names.
+    Returns the list of files written (empty if the file has no components).
+    Binary matrices are copied, or hard-linked to the input if link.
+    """
+    file_name = filepath.split("/")[-1]
+    token, file_names = split_names(file_name)
+    names = names or file_names
+    
+    if not names:
+        return []
+    
+    out_paths = [output_dir + file_name.replace("_" + token + "_", "_" + name + "_") if token else output_dir + file_name + "_" + name for name in names]
+    
+    splitter = pipeline.LabelSplitter(names, split)
+    
+    if filepath.endswith(".npy"):
+        split_binary_file(filepath, out_paths, splitter, link)
+        return out_paths
+    
+    file_item = codecs.open(filepath, "r", "utf-8")
+    out_files = [codecs.open(out_path, "w", "utf-8") for out_path in out_paths]
+    first_line = file_item.readline()
+    header = file_item.readline()
+    
+    for out_file in out_files:
+        out_file.write(first_line)
+        out_file.write(header)
+        
+    for line in file_item:
+        values, class_atr = line.rstrip("\n").rsplit("\t", 1)
+        
+        for out_file, component in zip(out_files, splitter.split(class_atr)):
+            out_file.write(values + "\t" + component + "\n")
+            
+    file_item.close()
+    
+    for out_file in out_files:
+        out_file.close()
+        
+    return out_paths
+
+
+#Split a binary Doc-Term file (".npy" matrix + ".labels" index): only the labels are split, the matrix is copied (or hard-linked, if link):
+def split_binary_file(filepath, out_paths, splitter, link=False):
+    labels_file = codecs.open(os.path.splitext(filepath)[0] + ".labels", "r", "utf-8")
+    out_files = [codecs.open(os.path.splitext(out_path)[0] + ".labels", "w", "utf-8") for out_path in out_paths]
+    
+    for class_atr in labels_file:
+        for out_file, component in zip(out_files, splitter.split(class_atr.rstrip("\n"))):
+            out_file.write(component + "\n")
+            
+    labels_file.close()
+    
+    for out_file, out_path in zip(out_files, out_paths):
+        out_file.close()
+        
+        if os.path.exists(out_path):
+            os.remove(out_path)
+            
+        if link:
+            try:
+                os.link(filepath, out_path)
+                continue
+            except OSError:    #Other file system (or no hard links).
+                pass
+                
+        shutil.copyfile(filepath, out_path)
+
+
+#Split a Doc-Term file - process pool task (uses the global script arguments, shared with workers by fork):
+def split_task(filepath):
+    return split_file(filepath, args.output, args.split, args.names.split(",") if args.names else None, args.link)
+    
 ################################################################################
 
 #Run:
-#python3 bag2bag.py --input output/bov/txt/ --output output/bov/txt/
+#python3 bag2bag.py --split - --input output/bov/txt/ --output output/bov/txt/
 
 #Defining script arguments: 
 parser = argparse.ArgumentParser(description="Convert a Doc-Term 'cat-pol' to Doc-Term 'cat' and 'pol'.")
 parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
 parser.add_argument("--split", metavar='PATH', type=str, action="store", dest="split", required=True, nargs="?", const=True, help='special "token" to split classes')
-parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of Doc-Term files')
+parser.add_argument("--names", metavar='LIST', type=str, action="store", dest="names", required=False, nargs="?", const=True, help='comma-separated names of the class components (def. from file names, e.g. "_cat-pol_" -> cat,pol)')
+parser.add_argument("--workers", metavar='NUM', type=natural, action="store", dest="workers", default=1, nargs="?", const=True, required=False, help='number of worker processes (files converted in parallel) - def. 1')
+parser.add_argument("--link", metavar='BOOL', type=str2bool, action="store", dest="link", nargs="?", const=True, default=False, required=False, help='hard-link the binary matrices (".npy") of the outputs to the input instead of copying them (same file: rewriting one rewrites all) - def. False')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of Doc-Term files (TAB or binary ".npy" + ".labels")')
 parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save Doc-Term files')
 args = parser.parse_args()    #Verifying arguments.
 
@@ -111,7 +172,7 @@ if args.log:
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
 print("")
-total_start = time.time()
+run = instrumentation.Run("bag2bag", vars(args))
 
 ################################################################################
 ### INPUT (LOADING FILES LIST)                                               ###
@@ -123,50 +184,44 @@ if not os.path.exists(args.input):
     sys.exit()
      
 print("> Loading input files...\n")
-files = []
 filesList = []
  
-#Loading all files from root directory:     
+#Loading all files from root directory (only files with class components, e.g. "_cat-pol_"):     
 for catpol_fileItem in os.listdir(args.input):
-    filesList.append(args.input + catpol_fileItem)
+    if catpol_fileItem.endswith(".labels"):    #Labels index of a binary Doc-Term (".npy").
+        continue
+    
+    if args.names or split_names(catpol_fileItem)[0]:
+        filesList.append(args.input + catpol_fileItem)
               
 filesList.sort()
-filePath_i = 0
+
+if not os.path.exists(args.output):
+    os.makedirs(os.path.abspath(args.output), mode=0o755)
+
 total_num_examples = len(filesList)
-eta = 0
+total_output_files = 0
 print("> Converting input files:")
 print("..................................................")
-print_progress(filePath_i, total_num_examples, eta)
-             
+stage = run.stage("splitting", total_num_examples)
+
+#Files are split in parallel by forked workers; imap keeps them in order:
+if args.workers > 1:
+    pool = multiprocessing.get_context("fork").Pool(args.workers)
+    split_files = pool.imap(split_task, filesList)
+else:
+    split_files = map(split_task, filesList)
+    
 #Reading files:
-for filePath in filesList:
-    start = time.time()
-    catpol_fileItem = codecs.open(filePath, "r", "utf-8")
-    cat_fileItem = codecs.open(filePath.replace("_cat-pol_", "_cat_"), "w", "utf-8")
-    pol_fileItem = codecs.open(filePath.replace("_cat-pol_", "_pol_"), "w", "utf-8")
-    firstLine = catpol_fileItem.readline()
-    header = catpol_fileItem.readline()
-    cat_fileItem.write(firstLine)
-    pol_fileItem.write(firstLine)
-    cat_fileItem.write(header)
-    pol_fileItem.write(header)
-    lines = catpol_fileItem.readlines()
-    
-    for line in lines:
-        cells = line.split("\t")
-        class_atr = cells[-1].replace("\n", "")
-        newLine = '\t'.join(cells[:-1])
-        cat_fileItem.write(newLine + "\t" + class_atr.split(args.split)[0] + "\n")
-        pol_fileItem.write(newLine + "\t" + class_atr.split(args.split)[1] + "\n")
-    
-    catpol_fileItem.close()
-    cat_fileItem.close()
-    pol_fileItem.close()
-    filePath_i += 1
-    end = time.time()
-    eta = (total_num_examples-filePath_i)*(end-start)
-    print_progress(filePath_i, total_num_examples, eta)
+for out_paths in split_files:
+    total_output_files += len(out_paths)
+    stage.update()
+    
+if args.workers > 1:
+    pool.close()
+    pool.join()
      
+stage.finish()
 print("..................................................\n")
 
 ################################################################################
@@ -174,9 +229,9 @@ print("..................................................\n")
 
 ################################################################################
 
-total_end = time.time()
 print("> Log:")
 print("..................................................")
-print("- Time: " + str(format_time(total_end-total_start)))
-print("- Output files: " + str(total_num_examples*2))
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Output files: " + str(total_output_files))
 print("..................................................\n")
+run.save(args.metrics)
@@ -0,0 +1,344 @@
+#!/usr/bin/python3.4
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+from __future__ import print_function
+import argparse
+import codecs
+import instrumentation
+import json
+import logging
+import numpy
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Convert a string value to boolean:
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError("invalid boolean value: " + "'" + v + "'")
+
+
+#Verify if a value correspond to a natural number (it's an integer and bigger than 0):
+def natural(v):
+    try:
+        v = int(v)
+
+        if v > 0:
+            return v
+        else:
+            raise argparse.ArgumentTypeError("invalid natural number value: " + "'" + v + "'")
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid natural number value: " + "'" + v + "'")
+
+
+#Generate a vocabulary of distinct random lowercase words:
+def make_vocabulary(rand, size):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = set()
+
+    while len(vocabulary) < size:
+        vocabulary.add( ''.join(rand.choice(letters) for _ in range(rand.randint(2, 10))) )
+
+    vocabulary = sorted(vocabulary)
+    rand.shuffle(vocabulary)    #Word rank (frequency) independent of the alphabetical order.
+    return vocabulary
+
+
+#Generate a corpus of raw texts ("<class>/<file>"), words drawn by a Zipf law and some phrases (N-grams of the model):
+def make_corpus(corpus_dir, rand, vocabulary, phrases, classes, docs, words):
+    cum_weights = []
+    total = 0.0
+
+    for rank in range(1, len(vocabulary)+1):
+        total += 1.0 / rank
+        cum_weights.append(total)
+
+    for doc_i in range(docs):
+        class_dir = corpus_dir + classes[doc_i % len(classes)] + "/"
+
+        if not os.path.exists(class_dir):
+            os.makedirs(os.path.abspath(class_dir), mode=0o755)
+
+        text = codecs.open(class_dir + "doc" + str(doc_i).zfill(len(str(docs))) + ".txt", "w", "utf-8")
+        doc_words = max(1, int(rand.gauss(words, words / 4.0)))
+        paragraph = []
+        sentence = 0
+
+        while doc_words > 0:
+            if phrases and rand.random() < 0.05:
+                tokens = rand.choice(phrases).split("_")
+            else:
+                tokens = rand.choices(vocabulary, cum_weights=cum_weights, k=1)
+
+            if sentence == 0:
+                tokens = [tokens[0].capitalize()] + tokens[1:]
+
+            paragraph.extend(tokens)
+            doc_words -= len(tokens)
+            sentence += len(tokens)
+
+            #Punctuation (sentences and paragraphs) to be split by the tokenizer:
+            if rand.random() < 0.08 or doc_words <= 0:
+                paragraph[-1] += rand.choice([".", ".", "!", "?"])
+                sentence = 0
+
+                if rand.random() < 0.3 or doc_words <= 0:
+                    text.write(' '.join(paragraph) + "\n\n")
+                    paragraph = []
+            elif rand.random() < 0.05:
+                paragraph[-1] += ","
+
+        text.close()
+
+
+#Generate a W2V text model with the vocabulary (except a few words) and the phrases ("word1_word2"):
+def make_model(model_path, seed, vocabulary, phrases, dim, coverage=0.9):
+    rand = random.Random(seed)
+    entries = [word for word in vocabulary if rand.random() < coverage] + list(phrases)
+    matrix = numpy.random.RandomState(seed).uniform(-1.0, 1.0, (len(entries), dim)).astype(numpy.float32)
+    model = codecs.open(model_path, "w", "utf-8")
+    model.write(str(len(entries)) + " " + str(dim) + "\n")
+
+    for entry, vector in zip(entries, matrix):
+        model.write(entry + " " + ' '.join("%.6f" % value for value in vector) + "\n")
+
+    model.close()
+
+
+#Run a script (a benchmark stage) and get its wall/CPU time and run metrics (peak memory, stages):
+def run_stage(name, command, work_dir):
+    metrics_path = work_dir + name + "-metrics.json"
+    log_file = open(work_dir + name + ".log", "w")
+
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+
+    start = time.time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    process = subprocess.Popen([sys.executable] + command + ["--metrics", metrics_path], cwd=work_dir, stdout=log_file, stderr=subprocess.STDOUT)
+    process.wait()
+    wall_time = time.time()-start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)    #The script (including its start-up) and its workers.
+    log_file.close()
+
+    if process.returncode != 0 or not os.path.exists(metrics_path):
+        print("ERROR: stage '" + name + "' failed!")
+        print("\t!Log: " + work_dir + name + ".log")
+        sys.exit(1)
+
+    metrics_file = open(metrics_path, "r")
+    metrics = json.load(metrics_file)
+    metrics_file.close()
+    return {
+        "name": name,
+        "wall_time": wall_time,
+        "cpu_time": usage.ru_utime+usage.ru_stime - children.ru_utime-children.ru_stime,
+        "peak_memory": metrics["peak_memory"],
+        "stages": metrics["stages"]
+    }
+
+
+#Format a comparison with the baseline ("value (xSPEEDUP)", a speedup above 1 is better):
+def compare(value, baseline_value, unit):
+    text = "%.2f%s" % (value, unit)
+
+    if baseline_value is None:
+        return text
+
+    return text + " / %.2f%s (x%.2f)" % (baseline_value, unit, baseline_value / value if value > 0 else float("inf"))
+
+################################################################################
+
+
+################################################################################
+
+#Run:
+#python3 benchmark.py --output benchmark/ --docs 2000 --n_gram 3
+#python3 benchmark.py --output benchmark/ --docs 2000 --n_gram 3 --baseline benchmark/benchmark_1500000000.json
+
+#Defining script arguments:
+parser = argparse.ArgumentParser(description="Benchmark the pipeline (text2tok.py, text2bov.py, bag2bag.py, bag2arff.py) on a synthetic corpus and model.")
+parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
+parser.add_argument("--docs", metavar='NUM', type=natural, action="store", dest="docs", default=1000, nargs="?", const=True, required=False, help='number of synthetic documents - def. 1000')
+parser.add_argument("--words", metavar='NUM', type=natural, action="store", dest="words", default=200, nargs="?", const=True, required=False, help='average number of words per document - def. 200')
+parser.add_argument("--vocabulary", metavar='NUM', type=natural, action="store", dest="vocabulary", default=20000, nargs="?", const=True, required=False, help='number of distinct words - def. 20000')
+parser.add_argument("--phrases", metavar='NUM', type=natural, action="store", dest="phrases", default=2000, nargs="?", const=True, required=False, help='number of phrases (N-grams) in the model - def. 2000')
+parser.add_argument("--dim", metavar='NUM', type=natural, action="store", dest="dim", default=300, nargs="?", const=True, required=False, help='dimensions of the synthetic model - def. 300')
+parser.add_argument("--classes", metavar='LIST', type=str, action="store", dest="classes", default="sport-pos,sport-neg,politics-pos,politics-neg", nargs="?", const=True, required=False, help='comma-separated classes (directories) of the documents - def. sport-pos,sport-neg,politics-pos,politics-neg')
+parser.add_argument("--n_gram", metavar='NUM', type=natural, action="store", dest="n_gram", default=3, nargs="?", const=True, required=False, help='maximum N-gram order (text2bov.py) - def. 3')
+parser.add_argument("--workers", metavar='NUM', type=natural, action="store", dest="workers", default=1, nargs="?", const=True, required=False, help='number of worker processes (text2tok.py, text2bov.py, bag2bag.py) - def. 1')
+parser.add_argument("--binary", metavar='BOOL', type=str2bool, action="store", dest="binary", nargs="?", const=True, default=False, required=False, help='convert the model with w2v2bin.py and save binary Doc-Term matrices - def. False')
+parser.add_argument("--seed", metavar='NUM', type=int, action="store", dest="seed", default=1, nargs="?", const=True, required=False, help='random seed of the synthetic data - def. 1')
+parser.add_argument("--baseline", metavar='PATH', type=str, action="store", dest="baseline", required=False, nargs="?", const=True, help='results file of a previous benchmark to compare with')
+parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory of the synthetic data, stage outputs and results')
+args = parser.parse_args()    #Verifying arguments.
+
+################################################################################
+
+
+################################################################################
+
+#Setup logging:
+if args.log:
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+print("")
+tools_dir = os.path.dirname(os.path.abspath(__file__)) + "/"
+text2bov = os.path.join(tools_dir, "..", "representations", "bov", "text2bov.py")
+work_dir = os.path.abspath(args.output) + "/"
+data_dir = work_dir + "data/"
+config = {
+    "docs": args.docs,
+    "words": args.words,
+    "vocabulary": args.vocabulary,
+    "phrases": args.phrases,
+    "dim": args.dim,
+    "classes": args.classes,
+    "seed": args.seed
+}
+
+################################################################################
+
+
+################################################################################
+### SYNTHETIC DATA                                                           ###
+################################################################################
+
+#The data is generated again only if its configuration changed (same seed -> same data):
+config_path = data_dir + "config.json"
+current_config = None
+
+if os.path.exists(config_path):
+    config_file = open(config_path, "r")
+    current_config = json.load(config_file)
+    config_file.close()
+
+if current_config != config:
+    print("> Generating synthetic data...\n")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir + "corpus/", mode=0o755)
+    rand = random.Random(args.seed)
+    vocabulary = make_vocabulary(rand, args.vocabulary)
+    phrases = sorted(set( '_'.join(rand.sample(vocabulary[:len(vocabulary)//10], rand.randint(2, 3))) for _ in range(args.phrases) ))
+    make_corpus(data_dir + "corpus/", rand, vocabulary, phrases, args.classes.split(","), args.docs, args.words)
+    make_model(data_dir + "model.txt", args.seed, vocabulary, phrases, args.dim)
+    config_file = open(config_path, "w")
+    json.dump(config, config_file, indent=4, sort_keys=True)
+    config_file.close()
+    del vocabulary, phrases
+else:
+    print("> Using synthetic data (" + data_dir + ")...\n")
+
+################################################################################
+
+
+################################################################################
+### STAGES                                                                   ###
+################################################################################
+
+for stage_dir in ["tokenized/", "bov/", "arff/"]:
+    shutil.rmtree(work_dir + stage_dir, ignore_errors=True)
+    os.makedirs(work_dir + stage_dir, mode=0o755)
+
+workers = ["--workers", str(args.workers)]
+model_path = data_dir + "model.txt"
+results = []
+print("> Running stages:")
+print("..................................................")
+
+print("- text2tok.py")
+results.append( run_stage("text2tok", [tools_dir + "text2tok.py", "--input", data_dir + "corpus/", "--output", work_dir + "tokenized/"] + workers, work_dir) )
+
+if args.binary:
+    print("- w2v2bin.py")
+    results.append( run_stage("w2v2bin", [tools_dir + "w2v2bin.py", "--model", model_path, "--output", data_dir + "model.npy"], work_dir) )
+    model_path = data_dir + "model.npy"
+
+print("- text2bov.py")
+results.append( run_stage("text2bov", [text2bov, "--n_gram", str(args.n_gram), "--model", model_path, "--binary", str(args.binary), "--input", work_dir + "tokenized/tokenized_texts/", "--output", work_dir + "bov/"] + workers, work_dir) )
+print("- bag2bag.py")
+results.append( run_stage("bag2bag", [tools_dir + "bag2bag.py", "--split", "-", "--input", work_dir + "bov/", "--output", work_dir + "bov/"] + workers, work_dir) )
+print("- bag2arff.py")
+results.append( run_stage("bag2arff", [tools_dir + "bag2arff.py", "--input", work_dir + "bov/", "--output", work_dir + "arff/"], work_dir) )
+print("..................................................\n")
+
+################################################################################
+
+
+################################################################################
+### RESULTS                                                                  ###
+################################################################################
+
+benchmark = {
+    "config": dict(config, n_gram=args.n_gram, workers=args.workers, binary=args.binary),
+    "system": {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "cpus": os.cpu_count()
+    },
+    "start": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "results": results
+}
+results_path = work_dir + "benchmark_" + str( int(time.time()) ) + ".json"
+results_file = open(results_path, "w")
+json.dump(benchmark, results_file, indent=4, sort_keys=True)
+results_file.write("\n")
+results_file.close()
+baseline = {}
+
+if args.baseline:
+    baseline_file = open(args.baseline, "r")
+    baseline_benchmark = json.load(baseline_file)
+    baseline_file.close()
+
+    if baseline_benchmark["config"] != benchmark["config"]:
+        print("WARNING: the baseline has another configuration (results may not be comparable)!\n")
+
+    for result in baseline_benchmark["results"]:
+        baseline[result["name"]] = result
+
+        for stage in result["stages"]:
+            baseline[result["name"] + "/" + stage["name"]] = stage
+
+print("> Results" + (" (current / baseline):" if args.baseline else ":"))
+print("..................................................")
+
+for result in results:
+    base = baseline.get(result["name"], {})
+    print("- " + result["name"] + ": " + compare(result["wall_time"], base.get("wall_time"), "s") + ", CPU " + compare(result["cpu_time"], base.get("cpu_time"), "s") + ", peak " + compare(result["peak_memory"], base.get("peak_memory"), " MB"))
+
+    for stage in result["stages"]:
+        base = baseline.get(result["name"] + "/" + stage["name"], {})
+        print("\t" + stage["name"] + ": " + compare(stage["wall_time"], base.get("wall_time"), "s") + ", " + "%.1f items/s" % stage["items_per_second"] + ", p99 %.2fms" % (stage["latency"]["p99"]*1000))
+
+print("..................................................\n")
+
+print("> Log:")
+print("..................................................")
+print("- Documents: " + str(args.docs))
+print("- Total time: " + instrumentation.format_time(sum(result["wall_time"] for result in results)))
+print("- Results: " + results_path)
+print("..................................................\n")
@@ -0,0 +1,139 @@
+#!/usr/bin/python3.4
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+from __future__ import print_function
+import codecs
+import instrumentation
+import logging
+import os
+import sys
+import argparse
+import numpy
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Convert a string value to boolean:
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError("invalid boolean value: " + "'" + v + "'")
+
+
+#Write a binary Doc-Term file (float32 ".npy" matrix + ".labels" index) as a TAB Doc-Term file:
+def write_bag(filepath, bag_path):
+    matrix = numpy.load(filepath, mmap_mode="r")
+    labels_file = codecs.open(os.path.splitext(filepath)[0] + ".labels", "r", "utf-8")
+    bag_file = codecs.open(bag_path, "w", "utf-8")
+    bag_file.write(str(matrix.shape[0]) + " " + str(matrix.shape[1]) + "\n")
+    
+    for dim in range(1, matrix.shape[1]+1):
+        bag_file.write("d" + str(dim) + "\t")
+        
+    bag_file.write("class_atr\n")
+    
+    for row, class_atr in zip(matrix, labels_file):
+        bag_file.write("\t".join(str(value) for value in row) + "\t" + class_atr.rstrip("\n") + "\n")
+        
+    labels_file.close()
+    bag_file.close()
+    del matrix
+    
+################################################################################
+
+
+################################################################################
+
+#Run:
+#python3 bin2bag.py --input output/bov/bin/ --output output/bov/txt/
+
+#Defining script arguments: 
+parser = argparse.ArgumentParser(description="Convert binary Doc-Term matrices (\".npy\" + \".labels\") to Doc-Term matrices (TAB text).")
+parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of binary Doc-Term files')
+parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save the Doc-Term files')
+args = parser.parse_args()    #Verifying arguments.
+
+################################################################################
+
+
+################################################################################
+
+#Setup logging:
+if args.log:
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+print("")
+run = instrumentation.Run("bin2bag", vars(args))
+
+################################################################################
+
+
+################################################################################
+### INPUT (LOADING FILES LIST)                                               ###
+################################################################################
+
+if not os.path.exists(args.input):
+    print("ERROR: input directory does not exists!")
+    print("\t!Directory: " + args.input) 
+    sys.exit()
+     
+print("> Loading input files...\n")
+files_list = []
+ 
+#Loading all binary files from root directory:     
+for file_item in os.listdir(args.input):
+    if file_item.endswith(".npy"):
+        files_list.append(args.input + file_item)
+              
+files_list.sort()
+total_num_examples = len(files_list)
+
+################################################################################
+ 
+ 
+################################################################################
+### CONVERTING BINARY DOC-TERMs TO DOC-TERMs                                 ###
+################################################################################
+ 
+if not os.path.exists(args.output):
+    print("> Creating directory to Doc-Terms...\n")
+    os.makedirs(os.path.abspath(args.output), mode=0o755)
+     
+print("> Converting binary Doc-Terms to Doc-Terms:")
+print("..................................................")
+stage = run.stage("conversion", total_num_examples)
+  
+#Reading files:
+for filepath in files_list:
+    write_bag(filepath, args.output + os.path.splitext(filepath.split("/")[-1])[0])
+    stage.update()
+    
+stage.finish()
+print("..................................................\n")
+ 
+################################################################################
+
+
+################################################################################
+
+print("> Log:")
+print("..................................................")
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Files: " + str(total_num_examples))
+print("..................................................\n")
+run.save(args.metrics)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+#Progress bar and timing instrumentation shared by the scripts:
+#
+#   run = instrumentation.Run("text2bov")
+#   stage = run.stage("encoding", total_num_examples)
+#   for ...:
+#       stage.update(items)    #Throttled progress bar, per-item latency.
+#   stage.finish()
+#   run.save(args.metrics)     #Optional JSON metrics file.
+
+from __future__ import print_function
+import array
+import datetime
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import time
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+_columns = None    #Terminal width, read once.
+_last_print = 0.0
+
+
+#Get the terminal width (read only once, without forking "stty size"):
+def terminal_columns():
+    global _columns
+
+    if _columns is None:
+        _columns = shutil.get_terminal_size(fallback=(100, 24)).columns
+
+    return _columns
+
+
+#Format a value in seconds to "day, HH:mm:ss".
+def format_time(seconds):
+    return str( datetime.timedelta(seconds=max(0, int( math.ceil(seconds) ))) )
+
+
+# Print iterations progress: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
+def print_progress(iteration, total, estimation, prefix='Progress:', decimals=1, bar_length=100, final=False, interval=0.1):
+    """
+    Call in a loop to create terminal progress bar
+    @params:
+        iteration   - Required  : current iteration (Int)
+        total       - Required  : total iterations (Int, or None if unknown: only the count is shown)
+        estimation  - Required  : iteration estimation in seconds (Int)
+        prefix      - Optional  : prefix string (Str)
+        decimals    - Optional  : positive number of decimals in percent complete (Int)
+        bar_length  - Optional  : character length of bar (Int)
+        final       - Optional  : last call, ends the line (Bool)
+        interval    - Optional  : minimum seconds between two updates, except the first/last (Float)
+    """
+    global _last_print
+    now = time.time()
+
+    if not final and iteration not in (0, total) and now-_last_print < interval:
+        return
+
+    _last_print = now
+
+    if total is None:    #Unbounded (e.g. a stream): no bar nor ETA.
+        sys.stdout.write('\r%s %d items, %s' % (prefix, iteration, format_time(estimation)))
+        sys.stdout.write('\n' if final else '')
+        sys.stdout.flush()
+        return
+
+    eta = format_time(estimation)
+    bar_length = max(10, terminal_columns()-len(prefix)-len(eta)-15)
+    str_format = "{0:." + str(decimals) + "f}"
+    fraction = iteration / float(total) if total else 1.0    #Nothing to do.
+    percents = str_format.format(100 * fraction)
+    filled_length = int(round(bar_length * fraction))
+    bar = '█' * filled_length + '-' * (bar_length - filled_length)
+    sys.stdout.write('\r%s |%s| %s%s ETA %s' % (prefix, bar, percents, '%', eta))
+
+    if final == True:    #iteration == total
+        sys.stdout.write('\n')
+
+    sys.stdout.flush()
+
+
+#Get the CPU time (user + system) of this process and its finished children (e.g. pool workers):
+def cpu_time():
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+#Get the peak memory (MB) of this process (its own memory since exec, not the parent's) and its finished children:
+def peak_memory():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss    #KB (Linux).
+    
+    try:
+        status = open("/proc/self/status", "r")
+        
+        for line in status:
+            if line.startswith("VmHWM:"):
+                peak = int(line.split()[1])
+                
+        status.close()
+    except IOError:
+        pass
+        
+    return max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+
+#Get the percentile (nearest rank) of sorted values:
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+
+    return sorted_values[ min(len(sorted_values)-1, max(0, int( math.ceil(p / 100.0 * len(sorted_values)) )-1)) ]
+
+################################################################################
+
+
+################################################################################
+### CLASSES                                                                  ###
+################################################################################
+
+#Stage of a run (e.g. tokenizing, encoding): progress bar, wall/CPU time and per-item latencies (total None: unknown, items only counted).
+class Stage(object):
+
+    def __init__(self, name, total, progress=True):
+        self.name = name
+        self.total = total
+        self.items = 0
+        self.progress = progress
+        self.latencies = array.array('d')    #Seconds per item.
+        self.wall_start = time.time()
+        self.cpu_start = cpu_time()
+        self.last_update = self.wall_start
+        self.wall_time = None
+        self.cpu_time = None
+
+        if self.progress:
+            print_progress(0, self.total, 0)
+
+
+    #Count items done since the last update (their latency is the time since then, split among them, unless measured: latencies):
+    def update(self, items=1, latencies=None):
+        now = time.time()
+
+        if latencies is not None:
+            self.latencies.extend(latencies)
+        elif items > 0:
+            self.latencies.extend( [(now-self.last_update) / items] * items )
+
+        self.items += items
+        self.last_update = now
+
+        if self.progress and self.total is None:
+            print_progress(self.items, None, now-self.wall_start)    #Elapsed time.
+        elif self.progress:
+            rate = self.items / max(now-self.wall_start, 1e-9)    #Items per second since the beginning.
+            print_progress(self.items, self.total, (self.total-self.items) / rate if rate else 0)
+
+
+    #Finish the stage (final progress bar, wall/CPU times):
+    def finish(self):
+        self.wall_time = time.time()-self.wall_start
+        self.cpu_time = cpu_time()-self.cpu_start
+
+        if self.progress:
+            print_progress(self.items if self.total is None else self.total, self.total, self.wall_time, final=True)
+
+
+    #Summary of the stage (seconds, items per second and latency percentiles):
+    def summary(self):
+        wall_time = self.wall_time if self.wall_time is not None else time.time()-self.wall_start
+        cpu = self.cpu_time if self.cpu_time is not None else cpu_time()-self.cpu_start
+        latencies = sorted(self.latencies)
+        return {
+            "name": self.name,
+            "items": self.items,
+            "wall_time": wall_time,
+            "cpu_time": cpu,
+            "items_per_second": self.items / wall_time if wall_time > 0 else 0.0,
+            "latency": {
+                "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1] if latencies else 0.0
+            }
+        }
+
+
+#Run of a script: its stages and total wall/CPU time, optionally saved as a JSON metrics file.
+class Run(object):
+
+    def __init__(self, script, arguments=None):
+        self.script = script
+        self.arguments = arguments
+        self.stages = []
+        self.wall_start = time.time()
+        self.cpu_start = cpu_time()
+
+
+    #Start a new stage:
+    def stage(self, name, total, progress=True):
+        stage = Stage(name, total, progress)
+        self.stages.append(stage)
+        return stage
+
+
+    #Total wall time (seconds) since the run started:
+    def elapsed(self):
+        return time.time()-self.wall_start
+
+
+    #Summary of the run (with the summary of each stage):
+    def summary(self):
+        return {
+            "script": self.script,
+            "arguments": self.arguments,
+            "start": datetime.datetime.fromtimestamp(self.wall_start).isoformat(),
+            "wall_time": self.elapsed(),
+            "cpu_time": cpu_time()-self.cpu_start,
+            "peak_memory": peak_memory(),
+            "stages": [stage.summary() for stage in self.stages]
+        }
+
+
+    #Save the summary as a JSON metrics file (nothing is saved without a path):
+    def save(self, metrics_path):
+        if not metrics_path:
+            return
+
+        metrics_file = open(metrics_path, "w")
+        json.dump(self.summary(), metrics_file, indent=4, sort_keys=True)
+        metrics_file.write("\n")
+        metrics_file.close()
+
+################################################################################
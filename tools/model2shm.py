@@ -0,0 +1,131 @@
+#!/usr/bin/python3.4
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+from __future__ import print_function
+import argparse
+import instrumentation
+import logging
+import os
+import pipeline
+import signal
+import sys
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Convert a string value to boolean:
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError("invalid boolean value: " + "'" + v + "'")
+
+
+#Stop serving (SIGINT/SIGTERM):
+def stop(signum, frame):
+    raise KeyboardInterrupt()
+
+################################################################################
+
+
+################################################################################
+
+#Run:
+#python3 model2shm.py --model models/Google/GoogleVectors_300.npy --name google300
+#python3 text2bov.py --attach google300 --n_gram 3 --input input/dataset/tokenized/ --output output/bov/txt/
+
+#The model is loaded once into named shared memory segments ("/dev/shm/<name>_*") and served while this script runs;
+#text2bov.py jobs attach to it (no loading, one copy of the model in memory). The segments are removed on exit.
+
+#Defining script arguments:
+parser = argparse.ArgumentParser(description="Load a W2V model (text vectors or binary model) once in shared memory, to be attached by text2bov.py jobs.")
+parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
+parser.add_argument("--model", "-m", metavar='PATH', type=str, action="store", dest="model", required=True, nargs="?", const=True, help='input file of model (Word2Vec text vectors or binary ".npy" model)')
+parser.add_argument("--name", metavar='NAME', type=str, action="store", dest="name", required=True, nargs="?", const=True, help='name of the shared model (text2bov.py --attach NAME)')
+parser.add_argument("--quantize", metavar='NAME', type=str, action="store", dest="quantize", choices=["float16", "int8"], nargs="?", const="int8", required=False, help='share the model in reduced precision: "float16" or "int8" (rows quantized with a scale factor each) - def. float32')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+args = parser.parse_args()    #Verifying arguments.
+
+################################################################################
+
+
+################################################################################
+
+#Setup logging:
+if args.log:
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+print("")
+run = instrumentation.Run("model2shm", vars(args))
+
+################################################################################
+
+
+################################################################################
+### SHARING MODEL                                                            ###
+################################################################################
+
+if not os.path.exists(args.model):
+    print("ERROR: model file does not exists!")
+    print("\t!File: " + args.model)
+    sys.exit()
+
+if pipeline.shared_memory is None:
+    print("ERROR: shared models require Python 3.8+!")
+    sys.exit()
+
+print("> Loading model...\n")
+stage = run.stage("model loading", 1, progress=False)
+encoder = pipeline.BoVEncoder(args.model, quantize=args.quantize)
+stage.update()
+stage.finish()
+print("> Sharing model...\n")
+stage = run.stage("sharing", 1, progress=False)
+
+try:
+    segments = pipeline.share_model(args.name, encoder.vocabulary, encoder.matrix, encoder.prefixes)
+except FileExistsError:
+    print("ERROR: shared model already exists (served by another process)!")
+    print("\t!Name: " + args.name)
+    sys.exit()
+
+size = sum(segment.size for segment in segments)
+del encoder    #The private copy of the model (only the shared one is kept).
+stage.update()
+stage.finish()
+run.save(args.metrics)
+
+print("> Log:")
+print("..................................................")
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Name: " + args.name)
+print("- Size: " + "%.1f" % (size / 1048576.0) + " MB (" + (args.quantize or "float32") + ")")
+print("..................................................\n")
+
+#Serving until interrupted (Ctrl+C or SIGTERM), then removing the segments:
+print("> Serving model (Ctrl+C to stop)...\n")
+signal.signal(signal.SIGTERM, stop)
+
+try:
+    while True:
+        signal.pause()
+except KeyboardInterrupt:
+    pass
+
+for segment in segments:
+    segment.close()
+    segment.unlink()
+
+print("> Shared model removed.\n")
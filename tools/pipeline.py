@@ -0,0 +1,1120 @@
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+#In-process pipeline (raw texts -> tokens -> Bag of Vectors -> class components -> ARFF), without intermediate files.
+#The scripts (text2tok.py, text2bov.py, bag2bag.py, bag2arff.py) are command line wrappers of these objects:
+#
+#   tokenizer = pipeline.Tokenizer()
+#   encoder = pipeline.BoVEncoder("models/Google/GoogleVectors_300.npy")    #Loaded once (e.g. by a long-lived service).
+#   vector, found = encoder.encode(tokenizer.tokenize_text("Some text."), n_gram=2)
+#   vector, found = encoder.encode(tokenizer.tokenize_text("Some text."), n_gram=2, pooling="mean+max")    #See POOLINGS.
+#
+#   documents = pipeline.read_documents(pipeline.list_corpus("input/dataset/"))    #(id, class, text) - or any iterable.
+#   rows = pipeline.encode_documents(pipeline.tokenize_documents(documents, tokenizer), encoder, n_gram=2)
+#   rows = pipeline.split_labels(rows, pipeline.LabelSplitter(["cat", "pol"], "-"))
+#   writers = [pipeline.ArffWriter("output/bov_" + name + "_ng2.arff", "bov_" + name + "_ng2", encoder.dim, classes[name]) for name in ["cat", "pol"]]
+#
+#   for doc_id, components, vector in rows:
+#       for writer, class_atr in zip(writers, components):
+#           writer.write(vector, class_atr)
+
+from __future__ import print_function
+import codecs
+import collections
+import hashlib
+import io
+import itertools
+import json
+import numpy
+import os
+import re
+import tarfile
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:    #Python < 3.8 (only needed to share models, see tools/model2shm.py).
+    shared_memory = None
+
+try:
+    import nltk
+except ImportError:    #Only needed by the Tokenizer (bag2bag.py and bag2arff.py do not need NLTK).
+    nltk = None
+
+try:
+    import scipy.sparse
+except ImportError:    #Only needed by the TF-IDF weighting.
+    scipy = None
+
+POOLINGS = ["mean", "max", "min", "sum", "mean+max"]    #Strategies to pool the vectors of a document (see pool_batch).
+TEXT_PIECE = 65536    #Characters read at a time when a document is read in windows of tokens (longer lines are cut at their spaces).
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Create an empty matrix of vectors, in full precision (float64) or reduced precision ("float16", or "int8" quantized rows):
+def empty_matrix(shape, quantize=None):
+    if quantize == "int8":
+        return QuantizedMatrix(numpy.zeros(shape, dtype=numpy.int8), numpy.ones(shape[0], dtype=numpy.float32))
+
+    return numpy.zeros(shape, dtype=numpy.float16 if quantize == "float16" else numpy.float64)
+
+
+#Store a matrix of vectors in reduced precision ("float16" or "int8", see empty_matrix), a block of rows at a time:
+def quantize_matrix(matrix, quantize=None):
+    if quantize is None:
+        return matrix
+
+    quantized = empty_matrix(matrix.shape, quantize)
+
+    for start in range(0, matrix.shape[0], 65536):
+        quantized[start:start+65536] = matrix[start:start+65536]
+
+    return quantized
+
+
+#Load a model as a vocabulary index (word -> row) and a matrix of vectors:
+def load_model(model_path, words=None, quantize=None):
+    """
+    Binary models (".npy" + ".vocab", see tools/w2v2bin.py) are memory-mapped,
+    so concurrent jobs share a single copy of the matrix in page cache.
+    Text models (Word2Vec text vectors) are parsed into an in-memory matrix.
+    If a set of words is given, only their vectors are kept (in memory).
+    If quantize ("float16" or "int8"), the matrix is kept in memory in reduced
+    precision (text models are stored so while parsed, row by row).
+    """
+    vocabulary = {}
+
+    if model_path.endswith(".npy"):
+        matrix = numpy.load(model_path, mmap_mode="r")
+        vocab_file = codecs.open(os.path.splitext(model_path)[0] + ".vocab", "r", "utf-8")
+
+        for index, word in enumerate(vocab_file):
+            word = word.rstrip("\n")
+
+            if words is None or word in words:
+                vocabulary[word] = index
+
+        vocab_file.close()
+
+        if words is not None:
+            rows = sorted(vocabulary.values())
+            matrix = matrix[rows]    #Copy of the rows kept (the full matrix is no longer mapped).
+            new_rows = dict( zip(rows, range(len(rows))) )
+            vocabulary = dict( (word, new_rows[index]) for word, index in vocabulary.items() )
+
+        return vocabulary, quantize_matrix(matrix, quantize)
+
+    model = open(model_path, "r")
+    model_size, model_dim = [int(value) for value in model.readline().split()]    #Header: "<words> <dimensions>".
+
+    if words is not None:
+        rows = []
+
+        for vector in model:
+            head = vector.lstrip().split(' ', 1)[0].strip()
+
+            if head not in words:
+                continue
+
+            data = vector.strip().split(' ')
+            data.pop(0)
+
+            if head in vocabulary:    #Repeated word: the last vector is kept.
+                rows[vocabulary[head]] = [float(elt) for elt in data]
+            else:
+                vocabulary[head] = len(rows)
+                rows.append([float(elt) for elt in data])
+
+        model.close()
+        return vocabulary, quantize_matrix(numpy.array(rows).reshape(len(rows), model_dim), quantize)
+
+    matrix = empty_matrix((model_size, model_dim), quantize)
+
+    for index, vector in enumerate(model):
+        data = vector.strip().split(' ')
+        head = data[0].strip()
+        data.pop(0)
+        vocabulary[head] = index
+        matrix[index] = [float(elt) for elt in data]
+
+    model.close()
+    return vocabulary, matrix
+
+
+#Save a model as a binary model (".npy" matrix + ".vocab" index, see tools/w2v2bin.py), with its metadata (".meta" JSON), if any:
+def save_model(model_path, vocabulary, matrix, meta=None):
+    numpy.save(model_path, matrix)
+    vocab_file = codecs.open(os.path.splitext(model_path)[0] + ".vocab", "w", "utf-8")
+
+    for word in sorted(vocabulary, key=vocabulary.get):
+        vocab_file.write(word + "\n")
+
+    vocab_file.close()
+
+    if meta is not None:
+        meta_file = open(os.path.splitext(model_path)[0] + ".meta", "w")
+        json.dump(meta, meta_file, indent=4, sort_keys=True)
+        meta_file.write("\n")
+        meta_file.close()
+
+
+#Load the metadata (".meta" JSON) saved with a binary model (None if there is none):
+def load_meta(model_path):
+    meta_path = os.path.splitext(model_path)[0] + ".meta"
+
+    if not os.path.exists(meta_path):
+        return None
+
+    meta_file = open(meta_path, "r")
+    meta = json.load(meta_file)
+    meta_file.close()
+    return meta
+
+
+#Get a fingerprint (SHA-1) of a corpus from the path, size and modification time of its files (or of a packed corpus):
+def corpus_fingerprint(input_path):
+    fingerprint = hashlib.sha1()
+    paths = [input_path] if is_packed(input_path) else list_corpus(input_path)
+
+    for path in paths:
+        status = os.stat(path)
+        fingerprint.update((os.path.relpath(path, input_path) + "\t" + str(status.st_size) + "\t" + str(status.st_mtime_ns) + "\n").encode("utf-8"))
+
+    return fingerprint.hexdigest()
+
+
+#Share a model (vocabulary index, matrix and phrase index) in named shared memory segments, returning the segments:
+def share_model(name, vocabulary, matrix, prefixes, dtype=numpy.float32):
+    """
+    Segments: "<name>_matrix" (and "<name>_scales", int8 quantized), "<name>_vocab"
+    (words by row), "<name>_prefixes" and "<name>_meta" (JSON: shapes and dtypes).
+    A matrix not quantized is shared as dtype (def. float32, as binary models).
+    The creator keeps them while serving and unlinks them (see tools/model2shm.py).
+    """
+    words = [""]*matrix.shape[0]    #Rows without word (repeated words) stay empty.
+
+    for word, index in vocabulary.items():
+        words[index] = word
+
+    arrays = {"matrix": matrix.values if isinstance(matrix, QuantizedMatrix) else matrix}
+    dtypes = {"matrix": matrix.values.dtype if isinstance(matrix, QuantizedMatrix) else matrix.dtype if matrix.dtype == numpy.float16 else numpy.dtype(dtype)}
+
+    if isinstance(matrix, QuantizedMatrix):
+        arrays["scales"] = matrix.scales
+        dtypes["scales"] = matrix.scales.dtype
+
+    blobs = {"vocab": "\n".join(words).encode("utf-8"), "prefixes": "\n".join(sorted(prefixes)).encode("utf-8")}
+    meta = {"arrays": dict( (key, [str(dtypes[key]), list(array.shape)]) for key, array in arrays.items() ), "blobs": dict( (key, len(blob)) for key, blob in blobs.items() )}
+    segments = []
+
+    for key, array in arrays.items():
+        segments.append( shared_memory.SharedMemory(name=name + "_" + key, create=True, size=max(1, array.size*dtypes[key].itemsize)) )
+        shared_array = numpy.ndarray(array.shape, dtype=dtypes[key], buffer=segments[-1].buf)
+
+        for start in range(0, array.shape[0], 65536):    #Block copies (a memory-mapped matrix is not fully read at once).
+            shared_array[start:start+65536] = array[start:start+65536]
+
+        del shared_array    #No view left on the segment (it can be closed).
+
+    for key, blob in list(blobs.items()) + [("meta", json.dumps(meta).encode("utf-8"))]:
+        segments.append( shared_memory.SharedMemory(name=name + "_" + key, create=True, size=max(1, len(blob))) )
+        segments[-1].buf[:len(blob)] = blob
+
+    return segments
+
+
+#Attach a named shared memory segment (not unlinked when this process ends, as its creator owns it):
+def attach_segment(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)    #Python >= 3.13.
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+#Attach a model shared by share_model, returning the segments, vocabulary index, matrix (no copy) and phrase index:
+def attach_model(name):
+    if shared_memory is None:
+        raise ImportError("Python 3.8+ is required to attach shared models")
+
+    segments = dict( (key, attach_segment(name + "_" + key)) for key in ["meta", "vocab", "prefixes"] )
+    meta = json.loads( bytes(segments["meta"].buf).rstrip(b"\0").decode("utf-8") )
+    arrays = {}
+
+    for key, (dtype, shape) in meta["arrays"].items():
+        segments[key] = attach_segment(name + "_" + key)
+        arrays[key] = numpy.ndarray(tuple(shape), dtype=numpy.dtype(dtype), buffer=segments[key].buf)
+
+    words = bytes(segments["vocab"].buf[:meta["blobs"]["vocab"]]).decode("utf-8").split("\n")
+    vocabulary = dict( (word, index) for index, word in enumerate(words) if word )
+    prefixes = set( bytes(segments["prefixes"].buf[:meta["blobs"]["prefixes"]]).decode("utf-8").split("\n") ) if meta["blobs"]["prefixes"] else set()
+    matrix = QuantizedMatrix(arrays["matrix"], arrays["scales"]) if "scales" in arrays else arrays["matrix"]
+    return segments, vocabulary, matrix, prefixes
+
+
+#Build the phrase index of a model: every "_" prefix of its phrases (e.g. "new_york_city" -> "new", "new_york"):
+def build_prefixes(vocabulary):
+    prefixes = set()
+
+    for word in vocabulary:
+        position = word.find("_")
+
+        while position != -1:
+            prefixes.add(word[:position])
+            position = word.find("_", position+1)
+
+    return prefixes
+
+
+#Get the matrix rows of the N-grams (up to N, joined by "_") found in model, walking the tokens against the phrase index:
+def find_rows(tokens, vocabulary, prefixes, n_gram, starts=None):
+    """
+    Same rows, in the same order, as looking up every N-gram of
+    nltk.everygrams(tokens, max_len=n_gram), but an N-gram is only extended
+    while it is a prefix of some model phrase, so only N-grams that can
+    match are built. Returns the rows and the rows of each order (1 to N).
+    If starts, only the N-grams starting at the first "starts" tokens are
+    walked (see carry_windows).
+    """
+    rows = []
+    order_rows = [[] for n in range(n_gram)]
+
+    for i, word in enumerate(itertools.islice(tokens, starts)):
+        for n in range(n_gram):
+            if n > 0:
+                if i+n >= len(tokens) or word not in prefixes:
+                    break
+
+                word = word + "_" + tokens[i+n]
+
+            if word in vocabulary:
+                rows.append(vocabulary[word])
+                order_rows[n].append(vocabulary[word])
+
+    return rows, order_rows
+
+
+#Sum a batch of documents (lists of matrix rows found), returning the sums and the number of vectors found:
+def sum_batch(documents_rows, matrix, extremes=False):
+    """
+    All rows found in the batch are gathered from the model in one block and
+    summed per document with numpy.add.reduce over axis 0. Reducing over axis 0
+    adds the rows in order (unlike numpy.add.reduceat, which uses pairwise
+    summation), so each sum is the same as adding the vectors one by one.
+    If extremes, the element-wise maxima and minima of each document are also
+    returned, from the same block (zero if no vector is found).
+    """
+    counts = numpy.array([len(rows) for rows in documents_rows], dtype=numpy.int64)
+    doc_sums = numpy.zeros((len(documents_rows), matrix.shape[1]))
+    doc_maxs = numpy.zeros(doc_sums.shape) if extremes else None
+    doc_mins = numpy.zeros(doc_sums.shape) if extremes else None
+    block = matrix[[row for rows in documents_rows for row in rows]]
+    offset = 0
+
+    for index, count in enumerate(counts):
+        if count != 0:
+            doc_sums[index] = numpy.add.reduce(block[offset:offset+count], axis=0, dtype=numpy.float64)
+
+            if extremes:
+                doc_maxs[index] = numpy.maximum.reduce(block[offset:offset+count], axis=0)
+                doc_mins[index] = numpy.minimum.reduce(block[offset:offset+count], axis=0)
+
+            offset += count
+
+    if extremes:
+        return doc_sums, counts, doc_maxs, doc_mins
+
+    return doc_sums, counts
+
+
+#Sum documents given as chunks (document index, rows of each order), gathering about "window" rows at a time (bounded memory):
+def sum_chunks(chunks, num_documents, matrix, window, orders=1, extremes=False):
+    """
+    Returns the sums and the number of vectors found of each order (orders x
+    documents). The sum of a document is continued in the next block by
+    reducing it with the new rows (float64, in order), so each sum is the
+    same as sum_batch over all the rows of the document (also the maxima and
+    minima, if extremes).
+    """
+    doc_sums = numpy.zeros((orders, num_documents, matrix.shape[1]))
+    counts = numpy.zeros((orders, num_documents), dtype=numpy.int64)
+    doc_extremes = (numpy.zeros(doc_sums.shape), numpy.zeros(doc_sums.shape)) if extremes else None
+    block_chunks = []
+    block_rows = 0
+
+    for index, order_rows in chunks:
+        block_chunks.append( (index, order_rows) )
+        block_rows += sum(len(rows) for rows in order_rows)
+
+        if block_rows >= window:
+            add_chunks(doc_sums, counts, block_chunks, matrix, doc_extremes)
+            block_chunks = []
+            block_rows = 0
+
+    add_chunks(doc_sums, counts, block_chunks, matrix, doc_extremes)
+
+    if extremes:
+        return (doc_sums, counts) + doc_extremes
+
+    return doc_sums, counts
+
+
+#Add chunks (document index, rows of each order) to the sums and counts of each order (and the maxima/minima), gathering their rows in one block:
+def add_chunks(doc_sums, counts, chunks, matrix, doc_extremes=None):
+    block = matrix[[row for index, order_rows in chunks for rows in order_rows for row in rows]]
+    offset = 0
+
+    for index, order_rows in chunks:
+        for n, rows in enumerate(order_rows):
+            if not rows:
+                continue
+
+            if counts[n, index] == 0:
+                doc_sums[n, index] = numpy.add.reduce(block[offset:offset+len(rows)], axis=0, dtype=numpy.float64)
+            else:
+                doc_sums[n, index] = numpy.add.reduce(numpy.vstack([doc_sums[n, index][None, :], block[offset:offset+len(rows)]]), axis=0, dtype=numpy.float64)
+
+            if doc_extremes is not None:
+                doc_maxs, doc_mins = doc_extremes
+                block_max = numpy.maximum.reduce(block[offset:offset+len(rows)], axis=0)
+                block_min = numpy.minimum.reduce(block[offset:offset+len(rows)], axis=0)
+                doc_maxs[n, index] = block_max if counts[n, index] == 0 else numpy.maximum(doc_maxs[n, index], block_max)
+                doc_mins[n, index] = block_min if counts[n, index] == 0 else numpy.minimum(doc_mins[n, index], block_min)
+
+            counts[n, index] += len(rows)
+            offset += len(rows)
+
+
+#Divide (arithmetic mean) the sums of a batch of documents (documents without vectors found stay zero):
+def mean_batch(doc_sums, counts):
+    found = counts > 0
+    doc_vectors = numpy.zeros(doc_sums.shape)
+    doc_vectors[found] = doc_sums[found] / counts[found][:, None]
+    return doc_vectors
+
+
+#Tell if pooling strategies need the maxima/minima of the vectors (not only their sums and counts):
+def needs_extremes(poolings):
+    return any(pooling not in ("mean", "sum") for pooling in poolings)
+
+
+#Pool the vectors of a batch of documents with a strategy of POOLINGS, from their sums, counts and (max, min, mean+max) maxima/minima:
+def pool_batch(pooling, doc_sums, counts, doc_maxs=None, doc_mins=None):
+    """
+    "mean+max" concatenates the mean and the maxima (twice the dimension).
+    Documents without vectors found stay zero with every strategy.
+    """
+    if pooling == "mean":
+        return mean_batch(doc_sums, counts)
+    elif pooling == "sum":
+        return doc_sums
+    elif pooling == "max":
+        return doc_maxs
+    elif pooling == "min":
+        return doc_mins
+    elif pooling == "mean+max":
+        return numpy.hstack([mean_batch(doc_sums, counts), doc_maxs])
+
+    raise ValueError("unknown pooling: " + str(pooling))
+
+
+#Format a block of document vectors as TAB rows (values + class) with one formatting operation for the whole block:
+def format_rows(doc_vectors, labels, found, precision=None):
+    """
+    Each value is written as its shortest repr (precision None) or in fixed-point
+    with "precision" decimals. Rows of documents without vectors found are
+    written as zeros ("0", or "0.000..." with a precision).
+    """
+    value_format = "%r\t" if precision is None else "%." + str(precision) + "f\t"
+    row_format = value_format*doc_vectors.shape[1] + "%s\n"
+    zeros = [0]*doc_vectors.shape[1]
+    values = []
+
+    for doc_vector, class_atr, vectors_found in zip(doc_vectors.tolist(), labels, found):
+        values.extend(doc_vector if vectors_found else zeros)
+        values.append(class_atr)
+
+    return (row_format*len(labels)) % tuple(values)
+
+
+#Check that a formatted TAB row holds a document vector within its precision (exact for the repr), raising ValueError otherwise:
+def check_row(row, doc_vector, precision=None):
+    values = numpy.array(row.split("\t")[:-1], dtype=numpy.float64)
+
+    if values.shape != doc_vector.shape:
+        raise ValueError("formatted row has " + str(values.shape[0]) + " values, expected " + str(doc_vector.shape[0]))
+
+    tolerance = 0.0 if precision is None else 0.5 * 10.0**-precision + numpy.abs(doc_vector) * 1e-15    #Half a unit of the last decimal.
+
+    if (numpy.abs(values-doc_vector) > tolerance).any():
+        raise ValueError("formatted row does not round-trip with precision " + str(precision))
+
+
+#Build a sparse Doc-Term count matrix (documents x model rows) from the lists of matrix rows found in each document:
+def count_matrix(documents_rows, num_rows):
+    if scipy is None:
+        raise ImportError("SciPy is required to build Doc-Term count matrices")
+
+    indptr = numpy.cumsum([0] + [len(rows) for rows in documents_rows])
+    indices = numpy.fromiter((row for rows in documents_rows for row in rows), dtype=numpy.int64, count=indptr[-1])
+    counts = scipy.sparse.csr_matrix((numpy.ones(len(indices)), indices, indptr), shape=(len(documents_rows), num_rows))
+    counts.sum_duplicates()    #Term frequencies.
+    return counts
+
+
+#Build a sparse Doc-Term count matrix (documents x model rows) from the counters (row -> count) of each document:
+def counter_matrix(documents_counters, num_rows):
+    if scipy is None:
+        raise ImportError("SciPy is required to build Doc-Term count matrices")
+
+    indptr = numpy.cumsum([0] + [len(counter) for counter in documents_counters])
+    indices = numpy.fromiter((row for counter in documents_counters for row in sorted(counter)), dtype=numpy.int64, count=indptr[-1])
+    data = numpy.fromiter((counter[row] for counter in documents_counters for row in sorted(counter)), dtype=numpy.float64, count=indptr[-1])
+    return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(documents_counters), num_rows))
+
+
+#Build sparse Doc-Term count matrices (one per order) from chunks (document index, rows of each order), as count_matrix:
+def count_chunks(chunks, num_documents, num_rows, orders=1):
+    counters = [[collections.Counter() for index in range(num_documents)] for n in range(orders)]
+
+    for index, order_rows in chunks:
+        for n, rows in enumerate(order_rows):
+            counters[n][index].update(rows)
+
+    return [counter_matrix(order_counters, num_rows) for order_counters in counters]
+
+
+#Get the (smoothed) inverse document frequencies of the columns of a Doc-Term count matrix: ln((1+D) / (1+df)) + 1:
+def idf_weights(counts):
+    """
+    Smoothed as in scikit-learn, so every weight is positive: a term found
+    in every document still counts (a document never loses all its weights).
+    """
+    df = numpy.bincount(counts.indices, minlength=counts.shape[1])
+    return numpy.log((1.0 + counts.shape[0]) / (1.0 + df)) + 1.0
+
+
+#Sum a batch of documents (rows of a sparse Doc-Term weights matrix) as weighted sums, also returning the sums of weights:
+def weighted_sum_batch(weights, matrix):
+    """
+    One sparse x dense product with the model sub-matrix of the terms used in
+    the batch (documents x terms) x (terms x dimensions).
+    """
+    used = numpy.unique(weights.indices)
+    doc_sums = weights[:, used].dot( numpy.asarray(matrix[used], dtype=numpy.float64) )
+    return numpy.asarray(doc_sums).reshape(weights.shape[0], matrix.shape[1]), numpy.asarray(weights.sum(axis=1)).ravel()
+
+
+#List the files of a corpus ("<class>/<file>" under the input directory), sorted:
+def list_corpus(input_dir):
+    files_list = []
+
+    for directory in os.listdir(input_dir):
+        for file_item in os.listdir(input_dir + "/" + directory):
+            files_list.append(input_dir + directory + "/" + file_item)
+
+    files_list.sort()
+    return files_list
+
+
+#Read the documents of a files list, yielding (file, class, text) - the class is the name of the file directory:
+def read_documents(files_list):
+    for file_path in files_list:
+        file_input = codecs.open(file_path, "r", "utf-8")
+        text = file_input.read()
+        file_input.close()
+        yield file_path, file_path.split('/')[-2].strip(), text
+
+
+#Verify if a corpus path is a packed corpus (a JSONL file or a tar archive) instead of a directory:
+def is_packed(corpus_path):
+    return corpus_path.endswith((".jsonl", ".tar", ".tar.gz", ".tgz"))
+
+
+#Read a packed corpus sequentially (streaming), yielding (id, class, text) in the order of its records:
+def read_packed(corpus_path):
+    """
+    JSONL: one record {"id": ..., "class": ..., "text": ...} per line.
+    tar: one member "<class>/<file>" per document, the class is the name of
+    its directory (as in a corpus directory).
+    """
+    if corpus_path.endswith(".jsonl"):
+        corpus_file = codecs.open(corpus_path, "r", "utf-8")
+
+        for line in corpus_file:
+            if line.strip():
+                record = json.loads(line)
+                yield str(record["id"]), record["class"], record["text"]    #Numeric ids (e.g. {"id": 0}) as text.
+
+        corpus_file.close()
+        return
+
+    archive = tarfile.open(corpus_path, "r|*")    #Stream (no random access, compressed or not).
+
+    for member in archive:
+        if not member.isfile():
+            continue
+
+        if "/" not in member.name:
+            raise ValueError("document without class directory: " + member.name + " in " + corpus_path)
+
+        yield member.name, member.name.split('/')[-2].strip(), archive.extractfile(member).read().decode("utf-8")
+
+    archive.close()
+
+
+#Read a corpus (directory or packed corpus), yielding (id, class, text):
+def read_corpus(corpus_path):
+    if is_packed(corpus_path):
+        return read_packed(corpus_path)
+
+    return read_documents(list_corpus(corpus_path))
+
+
+#Get the tokens of a tokenized text (lines of tokens separated by spaces):
+def text_tokens(text):
+    return " ".join( [l.strip() for l in text.splitlines()] ).split(" ")
+
+
+#Read the tokens of a tokenized document:
+def read_tokens(file_path):
+    file_input = codecs.open(file_path, "r", "UTF-8")
+    tokens = text_tokens(file_input.read())    #The same lines as readlines (codecs splits with str.splitlines).
+    file_input.close()
+    return tokens
+
+
+#Read a text file in pieces of at most "size" characters (no newline translation, as codecs):
+def read_pieces(file_path, size=TEXT_PIECE):
+    file_input = io.open(file_path, "r", encoding="utf-8", newline="")
+
+    for piece in iter(lambda: file_input.read(size), ""):
+        yield piece
+
+    file_input.close()
+
+
+#Get the tokens of a text given in pieces (e.g. read_pieces), in windows of at most "window" tokens:
+def token_windows(pieces, window):
+    """
+    The same tokens as text_tokens of the whole text (lines stripped, joined
+    by a space and split by spaces), keeping only a window of tokens and the
+    current line: a line longer than TEXT_PIECE is cut at a space followed by
+    more text (its tokens are taken, the rest of the line is kept).
+    """
+    tokens = []
+    line = ""    #Current line, not ended yet.
+    continued = False    #Tokens of the current line were already taken (it is not stripped at the left again).
+    lines_read = False
+
+    for piece in itertools.chain(pieces, [None]):
+        if piece is None:    #End of the text: the last line ends.
+            lines = [line] if line else []
+            line = ""
+        else:
+            lines = (line + piece).splitlines(True)
+            last = lines[-1] if lines else ""
+            line = lines.pop() if last and (last.endswith("\r") or last.splitlines()[0] == last) else ""    #"\r" may be the first half of "\r\n".
+
+        for complete_line in lines:
+            content = complete_line.splitlines()[0]
+            tokens.extend( (content.rstrip() if continued else content.strip()).split(" ") )
+            continued = False
+            lines_read = True
+
+        if len(line) > TEXT_PIECE:
+            head, space, tail = line.rpartition(" ")
+
+            if space and tail.strip():
+                head = head if continued else head.lstrip()
+
+                if continued or head:
+                    tokens.extend(head.split(" "))
+                    continued = True
+
+                line = tail
+
+        while len(tokens) >= window:
+            yield tokens[:window]
+            del tokens[:window]
+
+    if not lines_read:
+        tokens = [""]    #Empty text (as text_tokens).
+
+    if tokens:
+        yield tokens
+
+
+#Carry the last N-1 tokens of each window of tokens to the next one, yielding the tokens and the number of N-gram starts to walk (see find_rows):
+def carry_windows(token_windows, n_gram):
+    """
+    The N-grams starting in the last N-1 tokens of a window are walked with
+    the next window, so the N-grams crossing a window boundary are found once,
+    in the same order as walking all the tokens at once.
+    """
+    carry = []
+
+    for tokens in token_windows:
+        tokens = carry + tokens
+        starts = max(len(tokens)-n_gram+1, 0)
+        carry = tokens[starts:]
+        yield tokens, starts
+
+    if carry:
+        yield carry, len(carry)
+
+
+#Map a function over an iterable in a process pool, a window of items at a time, yielding the results in order:
+def imap_window(pool, function, iterable, window, chunksize=1):
+    """
+    Pool.imap consumes the whole iterable at once; with a window, a stream
+    (e.g. a packed corpus) is only read as the results are consumed.
+    """
+    iterable = iter(iterable)
+
+    while True:
+        items = list(itertools.islice(iterable, window))
+
+        if not items:
+            return
+
+        for result in pool.imap(function, items, chunksize):
+            yield result
+
+
+#Tokenize documents (id, class, text), yielding (id, class, tokens):
+def tokenize_documents(documents, tokenizer):
+    for doc_id, class_atr, text in documents:
+        yield doc_id, class_atr, tokenizer.tokenize_text(text)
+
+
+#Encode documents (id, class, tokens) in batches, yielding (id, class, vector) - the mean of the vectors found (up to N):
+def encode_documents(documents, encoder, n_gram=1, batch=100, pooling="mean"):
+    """
+    The vector is a list of floats, or of int zeros if no vector is found
+    (as written by text2bov.py, so the ARFFs are the same as from the files).
+    The vectors of a document are pooled with a strategy of POOLINGS.
+    """
+    documents = iter(documents)
+
+    while True:
+        batch_documents = [document for _, document in zip(range(batch), documents)]
+
+        if not batch_documents:
+            return
+
+        doc_vectors, counts = encoder.encode_batch([tokens for _, _, tokens in batch_documents], n_gram, pooling)
+
+        for (doc_id, class_atr, tokens), doc_vector, vectors_found in zip(batch_documents, doc_vectors, counts):
+            yield doc_id, class_atr, doc_vector.tolist() if vectors_found != 0 else [0]*len(doc_vector)
+
+
+#Split the class of documents (id, class, vector) in its components, yielding (id, components, vector):
+def split_labels(documents, splitter):
+    for doc_id, class_atr, doc_vector in documents:
+        yield doc_id, splitter.split(class_atr), doc_vector
+
+
+#Quote an ARFF name/value when needed (as Weka does):
+def quote(value):
+    if value == "" or any(c in value for c in " \t\n\r,{}%'\"\\?"):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t") + "'"
+
+    return value
+
+################################################################################
+
+
+################################################################################
+### CLASSES                                                                  ###
+################################################################################
+
+#Tokenizer of raw texts (NLTK), paragraph by paragraph:
+class Tokenizer(object):
+
+    def __init__(self):
+        if nltk is None:
+            raise ImportError("NLTK is required to tokenize texts")
+
+        nltk.tokenize.word_tokenize("Loading tokenizer.")    #Loading the tokenizer models (e.g. punkt) once.
+
+
+    #Tokenize a paragraph:
+    def tokenize(self, paragraph):
+        return nltk.tokenize.word_tokenize(paragraph)    #Work well for many European languages.
+
+
+    #Tokenize lines of a text, yielding the tokens of each paragraph (lines are stripped, blank lines are ignored):
+    def tokenize_lines(self, lines):
+        for paragraph in lines:
+            paragraph = paragraph.strip()    #Removing extra spaces
+
+            if not paragraph: continue    #Ignoring blank line.
+
+            #The order is very important to extract knowledge:
+            yield self.tokenize(paragraph)
+
+
+    #Tokenize a text, returning the tokenized text (one line of tokens separated by spaces per paragraph):
+    def tokenized_text(self, text):
+        return "".join( ' '.join(tokens) + "\n" for tokens in self.tokenize_lines(text.splitlines()) )
+
+
+    #Tokenize a text, returning its tokens (the same as reading back its tokenized file, see read_tokens):
+    def tokenize_text(self, text):
+        return text_tokens(self.tokenized_text(text))
+
+
+#Tokenizer of raw texts with a few precompiled patterns (no NLTK): the rules of word_tokenize merged, for speed:
+class FastTokenizer(Tokenizer):
+    """
+    The Treebank substitutions of nltk.tokenize.word_tokenize are merged in a
+    few patterns (same order). The sentence splitting (punkt) is approximated:
+    a period ending a word followed by a space ends a sentence, unless the word
+    is an initial, an abbreviation (ABBREVIATIONS) or ends an ellipsis.
+    tokcompare.py reports the mismatch rate with word_tokenize on a corpus.
+    """
+
+    ABBREVIATIONS = set(["mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "ft", "vs", "etc", "e.g", "i.e", "u.s", "u.k", "u.n",
+        "a.m", "p.m", "inc", "corp", "co", "ltd", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+        "gen", "gov", "sen", "rep", "rev", "col", "lt", "sgt", "capt", "fig", "vol", "no", "pp"])
+    STARTING_QUOTE = re.compile(r'^"')
+    STARTING_QUOTES = re.compile(r'(?=["\'])(?<=[ (\[{<`«“‘„])(?:"|\'\')')
+    OPENING_QUOTE = re.compile(r"(?i)'(?<!\w')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)")
+    COMMAS = re.compile(r"([:,])([^\d]|$)")
+    SENTENCE_END = re.compile(r"(?<!\S)(\S*?)\.(?=[?!)\";}\]*:@'({\[]|\s+(\S))")
+    TOKEN_START = re.compile(r"[(\[{<\"`«“‘„:;&#*@)}\],]")
+    NUMBER = re.compile(r"^-?[\.,]?\d[\d,\.-]*$")
+    FINAL_PERIOD = re.compile(r"([^\.])(\.)([\]\)}>\"'»”’ ]*)\s*$")
+    ISOLATED = re.compile(r"[«“‘„»”’;@#$%&?!*\[\](){}<>‒-―]|``|`|\.{2,}|--")
+    CLOSING_QUOTE = re.compile(r"([^'])' ")
+    DOUBLE_QUOTES = re.compile(r"''|\"")
+    CLITICS = re.compile(r"(?=['nN])(?<=[^' ])('[sS]|'[mM]|'[dD]|'ll|'LL|'re|'RE|'ve|'VE|n't|N'T|') ")
+    CONTRACTIONS = re.compile(r"(?i)(?=[cdglmw ])(?:\b(?:(can)(not)|(d)('ye)|(gim)(me)|(gon)(na)|(got)(ta)|(lem)(me)|(more)('n))\b|\b(wan)(na)(?=\s)| ('t)(is|was)\b)")
+
+    def __init__(self):
+        pass
+
+
+    #Split the period of a word ending a sentence (not an initial, an abbreviation, an ellipsis or a number before a lowercase word):
+    def sentence_end(self, match):
+        word = match.group(1)
+        name = self.TOKEN_START.split(word)[-1].lower()    #The word without opening quotes/brackets.
+
+        if not word or word.endswith(".") or name in self.ABBREVIATIONS:
+            return match.group(0)
+
+        next_char = match.group(2) or ""
+
+        if (len(name) == 1 and name.isalpha() and (next_char.isupper() or next_char.islower())) or (next_char.islower() and self.NUMBER.match(name)):
+            return match.group(0)
+
+        return word + " . "
+
+
+    #Tokenize a paragraph:
+    def tokenize(self, paragraph):
+        text = self.STARTING_QUOTES.sub(" `` ", self.STARTING_QUOTE.sub(" `` ", paragraph))
+        text = self.OPENING_QUOTE.sub("' ", text)
+        text = self.SENTENCE_END.sub(self.sentence_end, text)
+        text = self.COMMAS.sub(r" \1 \2", text)
+        text = self.FINAL_PERIOD.sub(r"\1 \2 \3 ", text)
+        text = self.ISOLATED.sub(r" \g<0> ", text)
+        text = self.CLOSING_QUOTE.sub(r"\1 ' ", text)
+        text = " " + " ".join(self.DOUBLE_QUOTES.sub(" '' ", text).split()) + " "
+        text = self.CLITICS.sub(r" \1 ", text)
+        text = self.CONTRACTIONS.sub(lambda match: " " + " ".join(group for group in match.groups() if group) + " ", text)
+        return text.split()
+
+
+#Tokenizer with a bounded LRU cache of paragraphs (stripped text -> tokens) in front of another tokenizer:
+class CachedTokenizer(Tokenizer):
+    """
+    Repeated paragraphs (boilerplate, signatures, retweets) are tokenized once;
+    beyond "size" paragraphs the least recently used are dropped. The cache can
+    be saved and loaded between runs (see save). With "track", the paragraphs
+    tokenized since the last delta are kept, so that forked workers can send
+    them (and their hits/misses) to the parent cache (see merge).
+    """
+
+    def __init__(self, tokenizer, size=100000, track=False):
+        self.tokenizer = tokenizer
+        self.size = size
+        self.track = track
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.reported = (0, 0)    #Hits and misses of the last delta.
+        self.added = []
+
+
+    #Tokenize a paragraph (cached):
+    def tokenize(self, paragraph):
+        tokens = self.cache.get(paragraph)
+
+        if tokens is not None:
+            self.cache.move_to_end(paragraph)
+            self.hits += 1
+            return list(tokens)
+
+        tokens = self.tokenizer.tokenize(paragraph)
+        self.misses += 1
+        self.add(paragraph, tokens)
+
+        if self.track:
+            self.added.append( (paragraph, tokens) )
+
+        return tokens
+
+
+    #Add a paragraph and its tokens as the most recently used (dropping the least recently used beyond the size):
+    def add(self, paragraph, tokens):
+        self.cache[paragraph] = tuple(tokens)
+        self.cache.move_to_end(paragraph)
+
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+
+    #Hits, misses and new paragraphs (if tracked) since the last delta:
+    def delta(self):
+        delta = (self.hits-self.reported[0], self.misses-self.reported[1], self.added)
+        self.reported = (self.hits, self.misses)
+        self.added = []
+        return delta
+
+
+    #Merge the delta of another cache (e.g. of a worker process):
+    def merge(self, delta):
+        hits, misses, entries = delta
+        self.hits += hits
+        self.misses += misses
+
+        for paragraph, tokens in entries:
+            self.add(paragraph, tokens)
+
+
+    #Load a saved cache, returning False (nothing loaded) if it was saved by another tokenizer:
+    def load(self, cache_path, name):
+        cache_file = codecs.open(cache_path, "r", "utf-8")
+
+        if json.loads(cache_file.readline()).get("tokenizer") != name:
+            cache_file.close()
+            return False
+
+        for line in cache_file:
+            paragraph, tokens = json.loads(line)
+            self.add(paragraph, tokens.split())
+
+        cache_file.close()
+        return True
+
+
+    #Save the cache: a JSON header line ({"tokenizer": name}), then a JSON line [paragraph, tokens] per paragraph (least recently used first):
+    def save(self, cache_path, name):
+        cache_file = codecs.open(cache_path, "w", "utf-8")
+        cache_file.write(json.dumps({"tokenizer": name}) + "\n")
+
+        for paragraph, tokens in self.cache.items():
+            cache_file.write(json.dumps([paragraph, " ".join(tokens)], ensure_ascii=False) + "\n")
+
+        cache_file.close()
+
+
+#Matrix of vectors quantized to int8, one scale factor per row (row = values x scale), read as float32 rows:
+class QuantizedMatrix(object):
+
+    def __init__(self, values, scales):
+        self.values = values
+        self.scales = scales
+        self.shape = values.shape
+        self.dtype = values.dtype
+        self.nbytes = values.nbytes + scales.nbytes
+
+
+    #Get rows (an index, a slice or a list of rows), dequantized:
+    def __getitem__(self, rows):
+        return self.values[rows] * self.scales[rows][..., None]
+
+
+    #Set rows (an index or a slice) from vectors: each row is scaled to [-127, 127] by its maximum absolute value:
+    def __setitem__(self, rows, vectors):
+        vectors = numpy.asarray(vectors, dtype=numpy.float64)
+        scales = numpy.abs(vectors).max(axis=-1) / 127.0
+        scales = numpy.where(scales > 0, scales, 1.0)    #Zero vectors.
+        self.values[rows] = numpy.rint(vectors / scales[..., None])
+        self.scales[rows] = scales
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+#Bag of Vectors encoder: a model (vocabulary index and matrix of vectors) loaded once, to encode documents on demand:
+class BoVEncoder(object):
+
+    def __init__(self, model_path=None, words=None, phrases=True, quantize=None, shared=None):
+        """
+        See load_model (words keeps only their vectors, quantize stores them
+        in reduced precision). The phrase index, needed for N > 1, is built
+        now if phrases (before forking workers) or when it is first needed.
+        If shared, the model is attached from shared memory (see attach_model)
+        instead of loaded.
+        """
+        self.segments = None
+
+        if shared is not None:
+            self.segments, self.vocabulary, self.matrix, self.prefixes = attach_model(shared)
+        else:
+            self.vocabulary, self.matrix = load_model(model_path, words, quantize)
+            self.prefixes = build_prefixes(self.vocabulary) if phrases else None
+
+        self.dim = self.matrix.shape[1]
+
+
+    #Store the model in reduced precision ("float16" or "int8", see quantize_matrix); vectors are still summed in float64:
+    def quantize(self, quantize):
+        self.matrix = quantize_matrix(self.matrix, quantize)
+
+
+    #Get the matrix rows of the N-grams (up to N) found in model, and the rows of each order (see find_rows):
+    def find_rows(self, tokens, n_gram=1, starts=None):
+        if n_gram > 1 and self.prefixes is None:
+            self.prefixes = build_prefixes(self.vocabulary)
+
+        return find_rows(tokens, self.vocabulary, self.prefixes, n_gram, starts)
+
+
+    #Get the rows found in a document given in windows of tokens (see token_windows), window by window (see carry_windows):
+    def find_rows_windows(self, token_windows, n_gram=1):
+        for tokens, starts in carry_windows(token_windows, n_gram):
+            yield self.find_rows(tokens, n_gram, starts)
+
+
+    #Sum a batch of documents (lists of matrix rows found), returning the sums and the number of vectors found (and the maxima/minima, if extremes):
+    def sum_batch(self, documents_rows, extremes=False):
+        return sum_batch(documents_rows, self.matrix, extremes)
+
+
+    #Sum a batch of documents (rows of a sparse Doc-Term weights matrix) as weighted sums, also returning the sums of weights:
+    def weighted_sum_batch(self, weights):
+        return weighted_sum_batch(weights, self.matrix)
+
+
+    #Build a sparse Doc-Term count matrix (documents x model rows) of documents (lists of tokens), N-grams up to N:
+    def count_batch(self, documents_tokens, n_gram=1):
+        return count_matrix([self.find_rows(tokens, n_gram)[0] for tokens in documents_tokens], self.matrix.shape[0])
+
+
+    #Encode documents (lists of tokens) as their TF-IDF weighted mean vectors (zero if none found), the IDF from these documents:
+    def encode_tfidf(self, documents_tokens, n_gram=1):
+        counts = self.count_batch(documents_tokens, n_gram)
+        doc_sums, weights = self.weighted_sum_batch(counts.multiply(idf_weights(counts)).tocsr())
+        return mean_batch(doc_sums, weights), weights
+
+
+    #Pool a batch of documents (lists of matrix rows found) with each strategy of POOLINGS, gathering their vectors once (see sum_batch):
+    def pool_batch(self, documents_rows, poolings=("mean",)):
+        pooled = self.sum_batch(documents_rows, needs_extremes(poolings))    #Sums, counts (and maxima, minima).
+        return [pool_batch(pooling, *pooled) for pooling in poolings], pooled[1]
+
+
+    #Encode a batch of documents (lists of tokens), returning their pooled vectors (mean by default, zero if none found) and vectors found:
+    def encode_batch(self, documents_tokens, n_gram=1, pooling="mean"):
+        doc_vectors, counts = self.pool_batch([self.find_rows(tokens, n_gram)[0] for tokens in documents_tokens], [pooling])
+        return doc_vectors[0], counts
+
+
+    #Encode a document (list of tokens), returning its pooled vector (mean by default, zero if none found) and the number of vectors found:
+    def encode(self, tokens, n_gram=1, pooling="mean"):
+        doc_vectors, counts = self.encode_batch([tokens], n_gram, pooling)
+        return doc_vectors[0], int(counts[0])
+
+
+#Splitter of combined classes in their components (e.g. "catX-polY" -> "catX", "polY"):
+class LabelSplitter(object):
+
+    def __init__(self, names, split="-"):
+        self.names = names
+        self.split_token = split
+
+
+    #Split a class in its components (one per name):
+    def split(self, class_atr):
+        components = class_atr.split(self.split_token)
+
+        if len(components) != len(self.names):
+            raise ValueError("class '" + class_atr + "' has " + str(len(components)) + " components, expected " + str(len(self.names)) + " (" + "-".join(self.names) + ")")
+
+        return components
+
+
+#Writer of a packed corpus (JSONL records or tar members "<class>/<file>", see read_packed):
+class CorpusWriter(object):
+
+    def __init__(self, corpus_path):
+        self.corpus_file = None
+        self.archive = None
+
+        if corpus_path.endswith(".jsonl"):
+            self.corpus_file = codecs.open(corpus_path, "w", "utf-8")
+        else:
+            self.archive = tarfile.open(corpus_path, "w:gz" if corpus_path.endswith((".tar.gz", ".tgz")) else "w")
+
+
+    #Write a document (its tar member is named by its class and the last part of its id):
+    def write(self, doc_id, class_atr, text):
+        if self.corpus_file is not None:
+            self.corpus_file.write(json.dumps({"id": doc_id, "class": class_atr, "text": text}, ensure_ascii=False) + "\n")
+            return
+
+        data = text.encode("utf-8")
+        member = tarfile.TarInfo(class_atr + "/" + doc_id.split("/")[-1])
+        member.size = len(data)
+        self.archive.addfile(member, io.BytesIO(data))
+
+
+    #Close the packed corpus:
+    def close(self):
+        if self.corpus_file is not None:
+            self.corpus_file.close()
+        else:
+            self.archive.close()
+
+
+#Writer of an ARFF (Weka file) with numeric attributes "d1..dN" and a nominal "class_atr" (its values must be known):
+class ArffWriter(object):
+
+    def __init__(self, arff_path, relation, dim, classes):
+        self.arff_file = codecs.open(arff_path, "w", "utf-8")
+        self.arff_file.write("@relation " + quote(relation) + "\n\n")
+
+        for d_i in range(1, dim+1):
+            self.arff_file.write("@attribute d" + str(d_i) + " numeric\n")
+
+        self.arff_file.write("@attribute class_atr {" + ",".join(quote(class_atr) for class_atr in classes) + "}\n\n@data\n")
+
+
+    #Write a row: values (a sequence, or a string of comma-separated values, written as it is) and its class:
+    def write(self, values, class_atr):
+        if not isinstance(values, str):
+            values = ",".join(str(value) for value in values)
+
+        self.arff_file.write(values + "," + quote(class_atr) + "\n")
+
+
+    #Close the ARFF:
+    def close(self):
+        self.arff_file.close()
+
+################################################################################
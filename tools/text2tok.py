@@ -10,55 +10,22 @@
 ################################################################################
  
 from __future__ import print_function
-import datetime
 import argparse
 import codecs
+import instrumentation
 import logging
-import nltk
 import os
+import pipeline
 import sys
 import time
-import math
+import hashlib
+import multiprocessing
 
 
 ################################################################################
 ### FUNCTIONS                                                                ###
 ################################################################################
 
-# Print iterations progress: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
-def print_progress(iteration, total, estimation, prefix='Progress:', decimals=1, bar_length=100, final=False):
-    """
-    Call in a loop to create terminal progress bar
-    @params:
-        iteration   - Required  : current iteration (Int)
-        total       - Required  : total iterations (Int)
-        estimation  - Required  : iteration estimation in seconds (Int)
-        prefix      - Optional  : prefix string (Str)
-        suffix      - Optional  : suffix string (Str)
-        decimals    - Optional  : positive number of decimals in percent complete (Int)
-        bar_length  - Optional  : character length of bar (Int)
-    """
-    rows, columns = os.popen('stty size', 'r').read().split()
-    eta = str( datetime.timedelta(seconds=max(0, int( math.ceil(estimation) ))) )
-    bar_length = int(columns)-len(prefix)-len(eta)-15
-    str_format = "{0:." + str(decimals) + "f}"
-    percents = str_format.format(100 * (iteration / float(total)))
-    filled_length = int(round(bar_length * iteration / float(total)))
-    bar = '█' * filled_length + '-' * (bar_length - filled_length)
-    sys.stdout.write('\r%s |%s| %s%s ETA %s' % (prefix, bar, percents, '%', eta))
-
-    if final == True:    #iteration == total
-        sys.stdout.write('\n')
-        
-    sys.stdout.flush()
-    del rows
-
-
-#Format a value in seconds to "day, HH:mm:ss".
-def format_time(seconds):
-    return str( datetime.timedelta(seconds=max(0, int( math.ceil(seconds) ))) )
-
-
 #Convert a string value to boolean:
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
@@ -81,6 +48,88 @@ def natural(v):
     except ValueError:
         raise argparse.ArgumentTypeError("invalid natural number value: " + "'" + v + "'")
 
+
+#Tokenize a raw text file (paragraph by paragraph) to a new file, returning the new file and its SHA-1 hash:
+def tokenize_file(filepath, new_filepath):
+    """
+    Single streaming pass: lines are stripped, blank lines are ignored and each
+    paragraph is tokenized (global tokenizer) and written right away. The raw
+    file is only read.
+    """
+    new_dir = '/'.join( new_filepath.split("/")[:-1] ) + "/"
+    
+    if not os.path.exists(new_dir):
+        os.makedirs(os.path.abspath(new_dir), mode=0o755, exist_ok=True)    #Creating intermediated directories (workers may race)
+        
+    file_item = codecs.open(filepath, "r", "utf-8")
+    new_file_item = codecs.open(new_filepath, "w", "utf-8")
+    output_hash = hashlib.sha1()
+    
+    for tokens in tokenizer.tokenize_lines(file_item):
+        line = ' '.join(tokens) + "\n"
+        new_file_item.write(line)
+        output_hash.update(line.encode("utf-8"))
+        
+    file_item.close()
+    new_file_item.close()
+    return new_filepath, output_hash.hexdigest()
+
+
+#Get the SHA-1 hash of a file content:
+def hash_file(filepath):
+    file_item = open(filepath, "rb")
+    file_hash = hashlib.sha1(file_item.read()).hexdigest()
+    file_item.close()
+    return file_hash
+
+
+#Load a manifest (TAB lines "file \t input hash \t output hash"; the last line of a file wins):
+def load_manifest(manifest_path):
+    manifest = {}
+    
+    if os.path.exists(manifest_path):
+        manifest_file = codecs.open(manifest_path, "r", "utf-8")
+        
+        for line in manifest_file:
+            cells = line.rstrip("\n").split("\t")
+            
+            if len(cells) == 3:    #Ignoring a line cut by a crash.
+                manifest[cells[0]] = (cells[1], cells[2])
+                
+        manifest_file.close()
+        
+    return manifest
+
+
+#Get the cache hits, misses and new paragraphs since the last task (sent by the workers to the parent cache):
+def cache_delta():
+    if isinstance(tokenizer, pipeline.CachedTokenizer):
+        return tokenizer.delta()
+        
+    return 0, 0, []
+
+
+#Tokenize a pair (raw file, tokenized file) - process pool task:
+def tokenize_task(paths):
+    return tokenize_file(paths[0], paths[1]), cache_delta()
+
+
+#Tokenize a document (id, class, text) of a packed corpus - process pool task:
+def tokenize_record(record):
+    return record[0], record[1], tokenizer.tokenized_text(record[2]), cache_delta()
+
+
+#Save a tokenized text to a file (creating its directory):
+def save_text(new_filepath, text):
+    new_dir = '/'.join( new_filepath.split("/")[:-1] ) + "/"
+    
+    if not os.path.exists(new_dir):
+        os.makedirs(os.path.abspath(new_dir), mode=0o755, exist_ok=True)
+        
+    new_file_item = codecs.open(new_filepath, "w", "utf-8")
+    new_file_item.write(text)
+    new_file_item.close()
+
 ################################################################################
         
         
@@ -88,12 +137,23 @@ def natural(v):
 
 #Run:
 #python3 text2tok.py --input input/dataset/ --output input/dataset/tokenized/
+#python3 text2tok.py --input input/dataset.jsonl --output input/dataset_tokenized.jsonl
+
+#Packed corpus (millions of small documents): JSONL records {"id": ..., "class": ..., "text": ...} or a tar archive
+#of members "<class>/<file>", read as a stream; any of input and output can be a directory or a packed corpus.
 
 #Defining script arguments: 
 parser = argparse.ArgumentParser(description="Convert raw texts to tokenized texts.")
 parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
-parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory to load raw texts')
-parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save tokenized texts')
+parser.add_argument("--workers", metavar='NUM', type=natural, action="store", dest="workers", default=1, nargs="?", const=True, required=False, help='number of worker processes to tokenize the texts - def. 1')
+parser.add_argument("--chunk", metavar='NUM', type=natural, action="store", dest="chunk", default=32, nargs="?", const=True, required=False, help='number of files assigned to a worker at a time - def. 32')
+parser.add_argument("--tokenizer", metavar='NAME', type=str, action="store", dest="tokenizer", default="nltk", choices=["nltk", "fast"], nargs="?", const="nltk", required=False, help='tokenizer: "nltk" (word_tokenize) or "fast" (its rules in a few precompiled patterns, without NLTK; see tokcompare.py for the mismatch rate) - def. nltk')
+parser.add_argument("--cache", metavar='NUM', type=int, action="store", dest="cache", default=100000, nargs="?", const=True, required=False, help='number of paragraphs kept in the LRU cache of the tokenizer (repeated paragraphs are tokenized once; 0 = no cache) - def. 100000')
+parser.add_argument("--cache_file", metavar='PATH', type=str, action="store", dest="cache_file", required=False, nargs="?", const=True, help='file of the tokenizer cache: loaded if it exists, saved at the end (repeated paragraphs of previous runs are not tokenized again)')
+parser.add_argument("--incremental", metavar='BOOL', type=str2bool, action="store", dest="incremental", nargs="?", const=True, default=False, required=False, help='keep a manifest of content hashes and process only new or modified texts (resuming interrupted runs) - def. False')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory to load raw texts (or packed corpus: ".jsonl", ".tar", ".tar.gz")')
+parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output directory to save tokenized texts (or packed corpus: ".jsonl", ".tar", ".tar.gz")')
 args = parser.parse_args()    #Verifying arguments.
 
 ################################################################################
@@ -106,7 +166,7 @@ if args.log:
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
     
 print("")
-total_start = time.time()
+run = instrumentation.Run("text2tok", vars(args))
 texts_dir = ""
 ids_dir = ""
 babelfy_requests = 0
@@ -117,97 +177,169 @@ babelfy_requests = 0
 ################################################################################
 
 log = codecs.open("text2tok-log_" + str( int(time.time()) ) + ".txt", "w", "utf-8")
-print("> Removing empty lines:")
-print("..................................................")
 log.write("> Raw texts: " + args.input + "\n")
-files_list = []
-
-#Reading all files from all root directories:     
-for directory in os.listdir(args.input):
-    for file_item in os.listdir(args.input + "/" + directory):
-        files_list.append(args.input + directory + "/" + file_item)
-             
-files_list.sort()
-total_num_examples = len(files_list) 
-filepath_i = 0
-eta = 0
-print_progress(filepath_i, total_num_examples, eta)
-operation_start = time.time()
-
-#Reading database:
-for filepath in files_list:
-    start = time.time()
-    log.write("\t" + filepath + "\n")
-    file_item = codecs.open(filepath, "r", "utf-8")
-    paragraphs = [s.strip() for s in file_item.read().splitlines()]    #Removing extra spaces
-    file_item.close()
-    file_item = codecs.open(filepath, "w", "utf-8")
+
+packed = pipeline.is_packed(args.input) or pipeline.is_packed(args.output)
+
+if packed and args.incremental:
+    print("ERROR: incremental runs require directories (input and output)!")
+    sys.exit()
     
-    for paragraph in paragraphs:
-        if not paragraph.strip(): continue    #Ignoring blank line.
-        file_item.write(paragraph + "\n")
+#Reading all files from all root directories (a packed corpus is read once, as a stream: its size is known at the end):     
+if pipeline.is_packed(args.input):
+    files_list = []
+    total_num_examples = None
+else:
+    files_list = pipeline.list_corpus(args.input)
+    total_num_examples = len(files_list) 
+    
+tokenized_texts_location = args.output if pipeline.is_packed(args.output) else args.output + "tokenized_texts/" 
+pending_list = files_list
+removed_files = 0
 
-    file_item.close()
-    filepath_i += 1
-    end = time.time()
-    eta = (total_num_examples-filepath_i)*(end-start)
-    print_progress(filepath_i, total_num_examples, eta)   
-    
-operation_end = time.time()
-eta = operation_end-operation_start
-print_progress(total_num_examples, total_num_examples, eta, final=True)
-print("..................................................\n")
+#Skipping texts (and their tokenized texts) unchanged since the last run:
+if args.incremental:
+    print("> Checking manifest...\n")
+    manifest_path = args.output + "text2tok-manifest.txt"
+    manifest = load_manifest(manifest_path)
+    pending_list = []
+    input_hashes = {}
+    
+    for filepath in files_list:
+        entry = manifest.get(filepath.replace(args.input, ""))
+        new_filepath = filepath.replace(args.input, tokenized_texts_location)
+        input_hashes[filepath] = hash_file(filepath) if args.tokenizer == "nltk" else args.tokenizer + ":" + hash_file(filepath)    #Texts tokenized by another tokenizer are pending.
+        
+        if entry is None or entry[0] != input_hashes[filepath] or not os.path.exists(new_filepath) or entry[1] != hash_file(new_filepath):
+            pending_list.append(filepath)
+            
+    #Removing tokenized texts whose raw texts disappeared:
+    current_files = set( filepath.replace(args.input, "") for filepath in files_list )
+    
+    for file_name in list(manifest):
+        if file_name not in current_files:
+            if os.path.exists(tokenized_texts_location + file_name):
+                os.remove(tokenized_texts_location + file_name)
+                log.write("\tRemoved: " + tokenized_texts_location + file_name + "\n")
+                
+            del manifest[file_name]
+            removed_files += 1
+            
+    #Rewriting the manifest (compacted); new entries are appended as soon as each text is tokenized:
+    if not os.path.exists(args.output):
+        os.makedirs(os.path.abspath(args.output), mode=0o755)
+        
+    manifest_file = codecs.open(manifest_path, "w", "utf-8")
+    
+    for file_name in sorted(manifest):
+        manifest_file.write(file_name + "\t" + manifest[file_name][0] + "\t" + manifest[file_name][1] + "\n")
+        
+    manifest_file.flush()
+    
+total_pending = total_num_examples if pipeline.is_packed(args.input) else len(pending_list)
+
+for filepath in pending_list:
+    log.write("\t" + filepath + "\n")
+    
 print("> Creating directory for tokenized texts...\n")
-tokenized_texts_location = args.output + "tokenized_texts/" 
 log.write("\n\n\n> Tokenized texts: " + tokenized_texts_location + "\n")
 print("> Tokenizing raw texts:")
 print("..................................................")
-log.write("\tFiles: " + str(total_num_examples) + "\n\n")
+log.write("\tFiles: " + ("streamed" if total_pending is None else str(total_pending)) + "\n\n")
 
-for filepath in files_list:
+for filepath in pending_list:
     log.write("\t" + filepath + "\n")
      
-filepath_i = 0
-eta = 0
-print_progress(filepath_i, total_num_examples, eta)
-operation_start = time.time()
-log.write("\tFiles: " + str(total_num_examples) + "\n\n")
-
-#Reading database:
-for filepath in files_list:
-    start = time.time()
-    new_filepath = filepath.replace(args.input, tokenized_texts_location)
-    log.write("\t" + new_filepath + "\n")
-    file_item = codecs.open(filepath, "r", "utf-8")
-    paragraphs = [s.strip() for s in file_item.read().splitlines()]    #Removing extra spaces
-    file_item.close()
-    
-    for index, paragraph in enumerate(paragraphs):
-        #The order is very important to extract knowledge:
-        paragraphs[index] = nltk.tokenize.word_tokenize(paragraph)    #Work well for many European languages.          
-        
-    #Writing tokenized content to new file:
-    new_dir = '/'.join( new_filepath.split("/")[:-1] ) + "/"
+stage = run.stage("tokenization", total_pending)    #Unbounded for a packed corpus.
+log.write("\tFiles: " + ("streamed" if total_pending is None else str(total_pending)) + "\n\n")
+
+tasks = [(filepath, filepath.replace(args.input, tokenized_texts_location)) for filepath in pending_list]
+
+#The tokenizer is loaded once, before forking the workers; imap keeps the files in order (log and progress stay in the parent):
+tokenizer = pipeline.FastTokenizer() if args.tokenizer == "fast" else pipeline.Tokenizer()
+cache_loaded = 0
+
+#The workers send their new paragraphs to the parent cache only if it is saved:
+if args.cache > 0:
+    tokenizer = pipeline.CachedTokenizer(tokenizer, args.cache, track=args.cache_file is not None and args.workers > 1)
     
-    if not os.path.exists(new_dir):
-        os.makedirs(os.path.abspath(new_dir), mode=0o755)    #Creating intermediated directories
+    if args.cache_file and os.path.exists(args.cache_file):
+        if tokenizer.load(args.cache_file, args.tokenizer):
+            cache_loaded = len(tokenizer.cache)
+        else:
+            print("> Cache file of another tokenizer ignored: " + args.cache_file + "\n")
             
-    new_file_item = codecs.open(new_filepath, "w", "utf-8")
-                
-    for paragraph in paragraphs:
-        new_file_item.write(' '.join(paragraph) + "\n")
 
-    new_file_item.close()
-    filepath_i += 1
-    end = time.time()
-    eta = (total_num_examples-filepath_i)*(end-start)
-    print_progress(filepath_i, total_num_examples, eta)   
-    
-operation_end = time.time()
-eta = operation_end-operation_start
-print_progress(total_num_examples, total_num_examples, eta, final=True)
+if args.workers > 1:
+    pool = multiprocessing.get_context("fork").Pool(args.workers)
+    
+#Packed corpus: documents (id, class, text) streamed to the workers, a window at a time, and written in order:
+if packed:
+    documents = ((doc_id.replace(args.input, ""), class_atr, text) for doc_id, class_atr, text in pipeline.read_corpus(args.input))
+    writer = pipeline.CorpusWriter(args.output) if pipeline.is_packed(args.output) else None
+    
+    if args.workers > 1:
+        tokenized_records = pipeline.imap_window(pool, tokenize_record, documents, 4*args.workers*args.chunk, chunksize=args.chunk)
+    else:
+        tokenized_records = map(tokenize_record, documents)
+        
+    for doc_id, class_atr, text, delta in tokenized_records:
+        if args.workers > 1 and args.cache > 0:
+            tokenizer.merge(delta)
+            
+        if writer is not None:
+            writer.write(doc_id, class_atr, text)
+            log.write("\t" + doc_id + "\n")
+        else:
+            save_text(tokenized_texts_location + class_atr + "/" + doc_id.split("/")[-1], text)
+            log.write("\t" + tokenized_texts_location + class_atr + "/" + doc_id.split("/")[-1] + "\n")
+            
+        stage.update()
+        
+    if writer is not None:
+        writer.close()
+        
+    if total_num_examples is None:
+        total_num_examples = stage.items
+else:
+    if args.workers > 1:
+        tokenized_files = pool.imap(tokenize_task, tasks, chunksize=args.chunk)
+    else:
+        tokenized_files = map(tokenize_task, tasks)
+        
+    #Reading database:
+    for filepath, ((new_filepath, output_hash), delta) in zip(pending_list, tokenized_files):
+        if args.workers > 1 and args.cache > 0:
+            tokenizer.merge(delta)
+            
+        log.write("\t" + new_filepath + "\n")
+        
+        if args.incremental:
+            manifest_file.write(filepath.replace(args.input, "") + "\t" + input_hashes[filepath] + "\t" + output_hash + "\n")
+            manifest_file.flush()
+            
+        stage.update()
+        
+if args.workers > 1:
+    pool.close()
+    pool.join()
+    
+if args.incremental:
+    manifest_file.close()
+    
+stage.finish()
 print("..................................................\n")
 log.write("\n")
+
+#Tokenizer cache statistics (and the cache saved for the next runs):
+if args.cache > 0:
+    cache_stats = str(tokenizer.hits) + " hits, " + str(tokenizer.misses) + " misses (hit rate: " + "%.1f" % (100.0 * tokenizer.hits / max(tokenizer.hits+tokenizer.misses, 1)) + "%)"
+    log.write("> Tokenizer cache: " + cache_stats + "\n")
+    
+    if args.cache_file:
+        tokenizer.save(args.cache_file, args.tokenizer)
+        log.write("\tCache file: " + args.cache_file + " (paragraphs: " + str(len(tokenizer.cache)) + ", loaded: " + str(cache_loaded) + ")\n")
+        
 log.close()
 
 ################################################################################
@@ -215,9 +347,19 @@ log.close()
 
 ################################################################################
 
-total_end = time.time()
 print("> Log:")
 print("..................................................")
-print("- Time: " + str(format_time(total_end-total_start)))
+print("- Time: " + instrumentation.format_time(run.elapsed()))
 print("- Files: " + str(total_num_examples))
+print("- Tokenizer: " + args.tokenizer)
+
+if args.cache > 0:
+    print("- Cache: " + cache_stats)
+    
+
+if args.incremental:
+    print("- Skipped files (unchanged): " + str(total_num_examples-total_pending))
+    print("- Removed files: " + str(removed_files))
+    
 print("..................................................\n")
+run.save(args.metrics)
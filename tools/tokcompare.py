@@ -0,0 +1,166 @@
+#!/usr/bin/python3.4
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+from __future__ import print_function
+import argparse
+import codecs
+import difflib
+import instrumentation
+import logging
+import os
+import pipeline
+import sys
+import time
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Convert a string value to boolean:
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError("invalid boolean value: " + "'" + v + "'")
+
+
+#Tokenize paragraphs, returning their tokens and the time spent (seconds):
+def timed_tokenize(tokenizer, paragraphs):
+    start = time.time()
+    paragraphs_tokens = [tokenizer.tokenize(paragraph) for paragraph in paragraphs]
+    return paragraphs_tokens, time.time()-start
+
+
+#Count the tokens that differ between two tokenizations (replaced, removed or inserted tokens):
+def token_mismatches(tokens, other_tokens):
+    matcher = difflib.SequenceMatcher(a=tokens, b=other_tokens, autojunk=False)
+    return sum(max(i2-i1, j2-j1) for op, i1, i2, j1, j2 in matcher.get_opcodes() if op != "equal")
+
+################################################################################
+
+
+################################################################################
+
+#Run:
+#python3 tokcompare.py --input input/dataset/ --output tokcompare.txt
+
+#Both tokenizers of text2tok.py ("nltk" and "fast") are run on every paragraph of the corpus; the paragraphs
+#tokenized differently are saved as TAB lines "file \t paragraph \t nltk tokens \t fast tokens".
+
+#Defining script arguments:
+parser = argparse.ArgumentParser(description="Compare the fast tokenizer with NLTK (word_tokenize) on a corpus of raw texts: mismatch rate and speed.")
+parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+parser.add_argument("--input", "-i", metavar='PATH', type=str, action="store", dest="input", required=True, nargs="?", const=True, help='input directory of raw texts (or packed corpus: ".jsonl", ".tar", ".tar.gz")')
+parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=False, nargs="?", const=True, help='file to save the paragraphs tokenized differently')
+args = parser.parse_args()    #Verifying arguments.
+
+################################################################################
+
+
+################################################################################
+
+#Setup logging:
+if args.log:
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+print("")
+run = instrumentation.Run("tokcompare", vars(args))
+
+################################################################################
+
+
+################################################################################
+### COMPARING TOKENIZERS                                                     ###
+################################################################################
+
+if not os.path.exists(args.input):
+    print("ERROR: input does not exists!")
+    print("\t!Path: " + args.input)
+    sys.exit()
+
+try:
+    nltk_tokenizer = pipeline.Tokenizer()
+except ImportError:
+    print("ERROR: NLTK is required to compare the tokenizers!")
+    sys.exit()
+
+fast_tokenizer = pipeline.FastTokenizer()
+
+#A packed corpus is read once, as a stream (its size is known at the end):
+if pipeline.is_packed(args.input):
+    total_num_examples = None
+else:
+    total_num_examples = len(pipeline.list_corpus(args.input))
+    
+output = codecs.open(args.output, "w", "utf-8") if args.output else None
+num_paragraphs = 0
+num_tokens = 0
+paragraph_mismatches = 0
+document_mismatches = 0
+mismatches = 0
+nltk_time = 0.0
+fast_time = 0.0
+print("> Comparing tokenizers:")
+print("..................................................")
+stage = run.stage("comparison", total_num_examples)    #Unbounded for a packed corpus.
+
+for doc_id, class_atr, text in pipeline.read_corpus(args.input):
+    paragraphs = [paragraph.strip() for paragraph in text.splitlines() if paragraph.strip()]    #As tokenize_lines.
+    nltk_tokens, seconds = timed_tokenize(nltk_tokenizer, paragraphs)
+    nltk_time += seconds
+    fast_tokens, seconds = timed_tokenize(fast_tokenizer, paragraphs)
+    fast_time += seconds
+    document_mismatch = False
+
+    for paragraph, tokens, other_tokens in zip(paragraphs, nltk_tokens, fast_tokens):
+        num_tokens += len(tokens)
+
+        if tokens != other_tokens:
+            paragraph_mismatches += 1
+            mismatches += token_mismatches(tokens, other_tokens)
+            document_mismatch = True
+
+            if output is not None:
+                output.write(doc_id + "\t" + paragraph + "\t" + " ".join(tokens) + "\t" + " ".join(other_tokens) + "\n")
+
+    num_paragraphs += len(paragraphs)
+    document_mismatches += document_mismatch
+    stage.update()
+
+if output is not None:
+    output.close()
+
+total_num_examples = stage.items
+stage.finish()
+print("..................................................\n")
+
+################################################################################
+
+
+################################################################################
+
+print("> Log:")
+print("..................................................")
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Files: " + str(total_num_examples) + " (tokenized differently: " + str(document_mismatches) + ")")
+print("- Paragraphs: " + str(num_paragraphs) + " (tokenized differently: " + str(paragraph_mismatches) + ", " + "%.3f" % (100.0 * paragraph_mismatches / max(num_paragraphs, 1)) + "%)")
+print("- Tokens (NLTK): " + str(num_tokens) + " (different: " + str(mismatches) + ", " + "%.3f" % (100.0 * mismatches / max(num_tokens, 1)) + "%)")
+print("- Tokenizing time: NLTK " + "%.2f" % nltk_time + "s, fast " + "%.2f" % fast_time + "s (" + "%.1f" % (nltk_time / max(fast_time, 1e-9)) + "x)")
+
+if args.output:
+    print("- Differences: " + args.output)
+
+print("..................................................\n")
+run.save(args.metrics)
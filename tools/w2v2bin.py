@@ -0,0 +1,131 @@
+#!/usr/bin/python3.4
+# -*- coding: utf-8 -*-
+################################################################################
+##              Laboratory of Computational Intelligence (LABIC)              ##
+##             --------------------------------------------------             ##
+##      Developed (originally) by: João Antunes (joao4ntunes@gmail.com)       ##
+##       Laboratory: labic.icmc.usp.br    Personal: joaoantunes.esy.es        ##
+##                                                                            ##
+##      "Não há nada mais trabalhoso do que viver sem trabalhar". Seu Madruga ##
+################################################################################
+
+from __future__ import print_function
+import argparse
+import codecs
+import instrumentation
+import logging
+import numpy
+import os
+import sys
+
+
+################################################################################
+### FUNCTIONS                                                                ###
+################################################################################
+
+#Convert a string value to boolean:
+def str2bool(v):
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError("invalid boolean value: " + "'" + v + "'")
+
+################################################################################
+
+
+################################################################################
+
+#Run:
+#python3 w2v2bin.py --model models/Google/GoogleVectors_300.txt --output models/Google/GoogleVectors_300.npy
+
+#The binary model is a pair of files: a float32 matrix (NumPy ".npy", one row per vector) and a
+#vocabulary index (".vocab", one word per line, in the same order as the matrix rows).
+
+#Defining script arguments:
+parser = argparse.ArgumentParser(description="Convert a W2V model (text vectors) to a binary model (float32 matrix + vocabulary).")
+parser.add_argument("--log", metavar='BOOL', type=str2bool, action="store", dest="log", nargs="?", const=True, default=False, required=False, help='display log during the process - def. False')
+parser.add_argument("--model", "-m", metavar='PATH', type=str, action="store", dest="model", required=True, nargs="?", const=True, help='input file of model (Word2Vec text vectors)')
+parser.add_argument("--output", "-o", metavar='PATH', type=str, action="store", dest="output", required=True, nargs="?", const=True, help='output file of binary model (".npy" matrix, the ".vocab" index is saved alongside)')
+parser.add_argument("--metrics", metavar='PATH', type=str, action="store", dest="metrics", required=False, nargs="?", const=True, help='JSON file to save the run metrics (times, throughput, latencies)')
+args = parser.parse_args()    #Verifying arguments.
+
+################################################################################
+
+
+################################################################################
+
+#Setup logging:
+if args.log:
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+print("")
+run = instrumentation.Run("w2v2bin", vars(args))
+
+################################################################################
+
+
+################################################################################
+### CONVERTING MODEL                                                         ###
+################################################################################
+
+if not os.path.exists(args.model):
+    print("ERROR: model file does not exists!")
+    print("\t!File: " + args.model)
+    sys.exit()
+
+if not args.output.endswith(".npy"):
+    args.output += ".npy"
+
+vocab_path = os.path.splitext(args.output)[0] + ".vocab"
+model = open(args.model, "r")
+model_size, model_dim = [int(value) for value in model.readline().split()]    #Header: "<words> <dimensions>".
+matrix = numpy.lib.format.open_memmap(args.output, mode="w+", dtype=numpy.float32, shape=(model_size, model_dim))
+vocab_file = codecs.open(vocab_path, "w", "utf-8")
+print("> Converting model:")
+print("..................................................")
+vector_i = 0
+stage = run.stage("conversion", model_size)
+
+#Writing the vectors straight to the matrix file (the model is never fully loaded in memory):
+for vector in model:
+    data = vector.strip().split(' ')
+    head = data[0].strip()
+    data.pop(0)
+
+    if vector_i >= model_size:
+        print("\nERROR: model has more vectors than declared in its header!")
+        sys.exit()
+
+    matrix[vector_i] = [float(elt) for elt in data]
+    vocab_file.write(head + "\n")
+    vector_i += 1
+    stage.update()
+
+model.close()
+vocab_file.close()
+matrix.flush()
+del matrix
+stage.finish()
+print("..................................................\n")
+
+if vector_i != model_size:
+    print("ERROR: model has less vectors than declared in its header!")
+    print("\t!Vectors: " + str(vector_i) + " / " + str(model_size))
+    sys.exit()
+
+################################################################################
+
+
+################################################################################
+
+print("> Log:")
+print("..................................................")
+print("- Time: " + instrumentation.format_time(run.elapsed()))
+print("- Vectors: " + str(model_size))
+print("- Dimensions: " + str(model_dim))
+print("- Matrix: " + args.output)
+print("- Vocabulary: " + vocab_path)
+print("..................................................\n")
+run.save(args.metrics)